@@ -0,0 +1,291 @@
+"""
+Build step for the site's static assets:
+
+    python -m api._assets            # incremental
+    python -m api._assets --force    # rebuild everything
+
+Writes dist/ next to index.html:
+
+  - every file in static/ under a content-hashed name
+    (static/styles.css -> static/styles.1f2e3d4c5b.css), CSS and JS minified
+    first, so the files can be cached forever;
+  - index.html with its references to those files rewritten (and HTML
+    comments and indentation stripped);
+  - .gz (and .br, when the brotli package is installed) siblings of every
+    file compression makes at least MIN_SAVING smaller;
+  - manifest.json: source path -> hashed path, sizes, and the key each
+    output was built from.
+
+An input whose key (its bytes, the build options and, for index.html, the
+asset names it references) matches the manifest is skipped. The local
+server (api/_server.py) serves dist/ when it has been built: precompressed
+variants to clients that accept them, and hashed files with immutable
+cache headers.
+
+The leading underscore keeps Vercel from exposing this module as an endpoint.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional: .gz only
+    brotli = None
+
+ROOT = Path(__file__).resolve().parents[1]
+
+BUILD_DIR = Path(os.getenv("SITE_BUILD_DIR", ROOT / "dist"))
+MANIFEST_NAME = "manifest.json"
+BUILD_VERSION = 1  # bump when the minifiers change, to invalidate every output
+HASH_LENGTH = 10
+MIN_SAVING = 0.1
+COMPRESSIBLE = {".css", ".js", ".html", ".svg", ".json", ".txt", ".pdf", ".xml", ".ico"}
+# static/styles.1f2e3d4c5b.css
+HASHED_NAME = re.compile(r"\.[0-9a-f]{%d}\.[^./]+$" % HASH_LENGTH)
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_CSS_TOKENS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/""", re.S)
+_JS_REGEX_BEFORE = set("(,=:[!&|?{};+-*%<>~^") | {""}
+_HTML_VERBATIM = re.compile(r"<(pre|textarea)\b.*?</\1\s*>", re.S | re.I)
+_STATIC_REF = re.compile(r"""(["'(])/?(static/[^"'?#)\s]+)(\?[^"'#)\s]*)?""")
+
+
+def minify_css(text):
+    """Drop comments and the whitespace CSS doesn't need, leaving strings alone"""
+    text = _CSS_TOKENS.sub(lambda m: m.group(1) or "", text)
+    out, pos = [], 0
+    for match in _CSS_TOKENS.finditer(text):
+        out.append(_squeeze_css(text[pos:match.start()]))
+        out.append(match.group(0))
+        pos = match.end()
+    out.append(_squeeze_css(text[pos:]))
+    return "".join(out).replace(";}", "}").strip()
+
+
+def _squeeze_css(text):
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    # Only after ':' -- "a :hover" and "a:hover" are different selectors
+    return re.sub(r":\s+", ":", text)
+
+
+def minify_js(text):
+    """
+    Conservative: drop comments, indentation and blank lines, but keep the
+    line breaks (automatic semicolon insertion depends on them). Strings,
+    template literals and regex literals are copied as they are.
+    """
+    out, i, n = [], 0, len(text)
+    last = ""  # last significant character, to tell a regex from a division
+    while i < n:
+        c = text[i]
+        if c in "'\"`":
+            j = i + 1
+            while j < n and text[j] != c:
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i, last = j + 1, c
+        elif text.startswith("//", i):
+            while i < n and text[i] != "\n":
+                i += 1
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            out.append(" ")
+        elif c == "/" and last in _JS_REGEX_BEFORE:
+            j, in_class = i + 1, False
+            while j < n and text[j] != "\n" and (in_class or text[j] != "/"):
+                if text[j] == "\\":
+                    j += 1
+                elif text[j] in "[]":
+                    in_class = text[j] == "["
+                j += 1
+            out.append(text[i:j + 1])
+            i, last = j + 1, "/"
+        else:
+            out.append(c)
+            if not c.isspace():
+                last = c
+            elif c == "\n":
+                last = "" if last in ";{}" else last
+            i += 1
+    lines = (line.strip() for line in "".join(out).splitlines())
+    return "\n".join(line for line in lines if line) + "\n"
+
+
+def minify_html(text):
+    """Strip comments and indentation; <pre> and <textarea> content is left as it is"""
+    out, pos = [], 0
+    for match in _HTML_VERBATIM.finditer(text):
+        out.append(_squeeze_html(text[pos:match.start()]))
+        out.append(match.group(0))
+        pos = match.end()
+    out.append(_squeeze_html(text[pos:]))
+    return "".join(out).strip() + "\n"
+
+
+def _squeeze_html(text):
+    text = re.sub(r"<!--(?!\[if).*?-->", "", text, flags=re.S)
+    return re.sub(r"\n\s*", "\n", text)
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def content_hash(data, length=None):
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return digest[:length] if length else digest
+
+
+def hashed_name(rel_path, data):
+    path = Path(rel_path)
+    return str(path.with_name(f"{path.stem}.{content_hash(data, HASH_LENGTH)}{path.suffix}"))
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_variants(path, data, use_brotli=True):
+    """Write `data` and its compressed siblings; {encoding: bytes on disk}"""
+    _write(path, data)
+    sizes = {"identity": len(data)}
+    if path.suffix not in COMPRESSIBLE:
+        return sizes
+    candidates = [("gzip", ".gz", lambda d: gzip.compress(d, 9, mtime=0))]
+    if use_brotli and brotli is not None:
+        candidates.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+    for encoding, suffix, compress in candidates:
+        variant = path.with_name(path.name + suffix)
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            _write(variant, compressed)
+            sizes[encoding] = len(compressed)
+        elif variant.exists():
+            variant.unlink()
+    return sizes
+
+
+def _outputs_exist(out_dir, entry):
+    names = [entry["file"]] + [entry["file"] + s for e, s in (("gzip", ".gz"), ("br", ".br")) if e in entry["sizes"]]
+    return all((out_dir / name).exists() for name in names)
+
+
+def rewrite_references(html, assets):
+    """Point /static/... references (query strings like ?v=1 dropped) at the hashed files"""
+    def swap(match):
+        entry = assets.get(match.group(2))
+        if entry is None:
+            return match.group(0)
+        return f"{match.group(1)}/{entry['file']}"
+    return _STATIC_REF.sub(swap, html)
+
+
+def build(source=ROOT, out_dir=BUILD_DIR, force=False, use_brotli=True):
+    """Build (incrementally) into `out_dir`; returns the manifest"""
+    source, out_dir = Path(source), Path(out_dir)
+    manifest_path = out_dir / MANIFEST_NAME
+    try:
+        previous = {} if force else json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        previous = {}
+    old_assets = previous.get("assets", {})
+    options = f"v{BUILD_VERSION}|br={bool(use_brotli and brotli)}"
+    assets, built, skipped = {}, [], []
+
+    for path in sorted((source / "static").rglob("*")):
+        if not path.is_file() or path.name.startswith(".") or HASHED_NAME.search(path.name):
+            continue
+        rel = path.relative_to(source).as_posix()
+        data = path.read_bytes()
+        key = content_hash(data + options.encode())
+        entry = old_assets.get(rel)
+        if entry and entry["key"] == key and _outputs_exist(out_dir, entry):
+            assets[rel] = entry
+            skipped.append(rel)
+            continue
+
+        minify = MINIFIERS.get(path.suffix)
+        output = minify(data.decode("utf-8")).encode("utf-8") if minify else data
+        file = hashed_name(rel, output)
+        assets[rel] = {"file": file, "key": key, "source_bytes": len(data),
+                       "sizes": write_variants(out_dir / file, output, use_brotli)}
+        built.append(rel)
+
+    pages = {}
+    for page in ("index.html",):
+        data = (source / page).read_bytes()
+        refs = json.dumps({rel: entry["file"] for rel, entry in assets.items()}, sort_keys=True)
+        key = content_hash(data + options.encode() + refs.encode())
+        entry = previous.get("pages", {}).get(page)
+        if entry and entry["key"] == key and _outputs_exist(out_dir, entry):
+            pages[page] = entry
+            skipped.append(page)
+            continue
+        html = minify_html(rewrite_references(data.decode("utf-8"), assets)).encode("utf-8")
+        pages[page] = {"file": page, "key": key, "source_bytes": len(data),
+                       "sizes": write_variants(out_dir / page, html, use_brotli)}
+        built.append(page)
+
+    # Hashed files from earlier builds that nothing references any more
+    keep = {entry["file"] for entry in assets.values()}
+    for path in list((out_dir / "static").rglob("*")):
+        name = path.as_posix()
+        for suffix in (".gz", ".br"):
+            name = name[: -len(suffix)] if name.endswith(suffix) else name
+        if path.is_file() and Path(name).relative_to(out_dir).as_posix() not in keep:
+            path.unlink()
+
+    manifest = {"built_at": int(time.time()), "options": options, "assets": assets, "pages": pages,
+                "built": built, "skipped": skipped}
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(out_dir=BUILD_DIR):
+    """The last build's manifest, or None when dist/ hasn't been built"""
+    try:
+        return json.loads((Path(out_dir) / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def cache_control(path):
+    """Hashed files never change; everything else is revalidated"""
+    return IMMUTABLE if HASHED_NAME.search(str(path)) else "no-cache"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify, fingerprint and precompress the site's static assets")
+    parser.add_argument("--source", default=str(ROOT))
+    parser.add_argument("--out", default=str(BUILD_DIR))
+    parser.add_argument("--force", action="store_true", help="rebuild unchanged inputs too")
+    parser.add_argument("--no-brotli", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = build(args.source, args.out, args.force, not args.no_brotli)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'source':<30}{'output':<40}{'bytes':>9}{'min':>9}{'gzip':>9}{'br':>9}")
+    for rel, entry in {**manifest["assets"], **manifest["pages"]}.items():
+        sizes = entry["sizes"]
+        print(f"{rel:<30}{entry['file']:<40}{entry['source_bytes']:>9}{sizes['identity']:>9}"
+              f"{sizes.get('gzip', '-'):>9}{sizes.get('br', '-'):>9}")
+    if brotli is None and not args.no_brotli:
+        print("ℹ️ brotli isn't installed; only .gz variants were written")
+    print(f"📦 Built {len(manifest['built'])}, skipped {len(manifest['skipped'])} unchanged "
+          f"in {elapsed * 1000:.0f} ms -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
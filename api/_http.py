@@ -0,0 +1,176 @@
+"""
+Shared request/response plumbing for the api handlers.
+
+APIHandler is the BaseHTTPRequestHandler the endpoints subclass instead
+of each carrying its own _send_response/_cors:
+
+  - JSON goes through orjson when it is installed (stdlib json otherwise);
+  - every response has an explicit Content-Length, so HTTP/1.1 keep-alive
+    works (streams say Connection: close instead);
+  - bodies of GZIP_MIN_BYTES or more are gzipped for clients that accept it;
+  - GET responses carry an ETag and answer a matching If-None-Match with 304;
+  - CORS preflights are cached by the browser for PREFLIGHT_MAX_AGE seconds;
+  - request bodies are read in pieces up to a cap (413 beyond it), whatever
+    Content-Length claims, and chunked uploads are understood too.
+
+The leading underscore keeps Vercel from exposing this module as an endpoint.
+"""
+import gzip
+import hashlib
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is fine, just slower
+    orjson = None
+
+
+GZIP_MIN_BYTES = int(os.getenv("API_GZIP_MIN_BYTES", 1024))
+GZIP_LEVEL = 5
+MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", 64 * 1024))
+READ_CHUNK_BYTES = 16 * 1024
+PREFLIGHT_MAX_AGE = 86400
+
+
+def dumps(data):
+    """JSON-encode to bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass  # something orjson won't take; let json decide
+    return json.dumps(data).encode("utf-8")
+
+
+def loads(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class RequestError(Exception):
+    """A request the handler should answer with `status` and this message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    allow_methods = "GET,POST,OPTIONS"
+    allow_headers = "Content-Type, Accept"
+    max_body_bytes = MAX_BODY_BYTES
+
+    def send_cors_headers(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", self.allow_methods)
+        self.send_header("Access-Control-Allow-Headers", self.allow_headers)
+
+    def do_OPTIONS(self):
+        """CORS preflight, cacheable so browsers don't repeat it before every POST"""
+        self.send_response(204)
+        self.send_cors_headers()
+        self.send_header("Access-Control-Max-Age", str(PREFLIGHT_MAX_AGE))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, status, body, content_type, cache_control=None):
+        """Send a complete body with Content-Length, gzip and (on GET) ETag revalidation"""
+        headers = {"Content-Type": content_type}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+
+        if self.command == "GET" and status == 200:
+            # Weak: the gzipped and plain bodies share it
+            etag = 'W/"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            headers["ETag"] = etag
+            if etag in self.headers.get("If-None-Match", ""):
+                status, body = 304, b""
+
+        if len(body) >= GZIP_MIN_BYTES:
+            headers["Vary"] = "Accept-Encoding"
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, GZIP_LEVEL)
+                headers["Content-Encoding"] = "gzip"
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_cors_headers()
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json(self, status, data, cache_control="no-store"):
+        self.send_body(status, dumps(data), "application/json", cache_control)
+
+    def start_stream(self, content_type="text/event-stream"):
+        """Headers for a response of unknown length; the connection closes when it ends"""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Connection", "close")
+        self.send_cors_headers()
+        self.end_headers()
+
+    def read_body(self, limit=None):
+        """The request body, read in pieces; RequestError(413) past `limit` bytes"""
+        limit = self.max_body_bytes if limit is None else limit
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return self._read_chunked(limit)
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise RequestError(400, "Invalid Content-Length")
+        if length > limit:
+            self.close_connection = True  # the unread body would corrupt the next request
+            raise RequestError(413, "Request body too large")
+
+        pieces, remaining = [], length
+        while remaining > 0:
+            piece = self.rfile.read(min(remaining, READ_CHUNK_BYTES))
+            if not piece:
+                self.close_connection = True
+                raise RequestError(400, "Incomplete request body")
+            pieces.append(piece)
+            remaining -= len(piece)
+        return b"".join(pieces)
+
+    def _read_chunked(self, limit):
+        pieces, total = [], 0
+        while True:
+            line = self.rfile.readline(64)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                self.close_connection = True
+                raise RequestError(400, "Invalid chunked body")
+            if size == 0:
+                while self.rfile.readline(1024).strip():
+                    pass  # trailers
+                return b"".join(pieces)
+            total += size
+            if total > limit:
+                self.close_connection = True
+                raise RequestError(413, "Request body too large")
+            pieces.append(self.rfile.read(size))
+            self.rfile.readline(8)  # CRLF after the chunk
+
+    def read_json(self, limit=None):
+        """The request body as a JSON object; RequestError(400/413) otherwise"""
+        body = self.read_body(limit)
+        try:
+            data = loads(body) if body else {}
+        except ValueError:
+            raise RequestError(400, "Invalid JSON")
+        if not isinstance(data, dict):
+            raise RequestError(400, "Expected a JSON object")
+        return data
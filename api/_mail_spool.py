@@ -0,0 +1,349 @@
+"""
+Queued delivery for contact form emails.
+
+do_POST only has to persist the message into a local SQLite spool and can
+answer right away. A background sender drains the spool over one reused,
+authenticated SMTP connection: it reconnects when the server drops it,
+retries failures with jittered exponential backoff, and moves messages that
+keep failing (or are rejected outright) to an append-only dead-letter file.
+
+The background sender only runs in a long-lived process: api/_server.py
+calls start_mailer() at startup, which first sends whatever an earlier
+run left in the spool. Without it (a serverless function is frozen once
+the response is sent, and its temp dir doesn't outlive the instance)
+deliver() drains the spool inline before the handler answers, and
+reports whether the message actually went out.
+
+The leading underscore keeps Vercel from exposing this module as an endpoint.
+Point SMTP_SERVER/SMTP_PORT at a local stub (e.g. `python -m aiosmtpd -n`)
+with SMTP_STARTTLS=0 and SMTP_AUTH=0 (the stub doesn't offer AUTH) to
+exercise it without a real mail provider; EMAIL_USERNAME is still the
+recipient.
+"""
+import email
+import json
+import os
+import random
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+SPOOL_PATH = os.getenv(
+    "CONTACT_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "contact-spool.sqlite3")
+)
+DEAD_LETTER_PATH = os.getenv(
+    "CONTACT_DEAD_LETTER_PATH", os.path.join(tempfile.gettempdir(), "contact-dead-letter.jsonl")
+)
+MAX_ATTEMPTS = int(os.getenv("CONTACT_MAX_ATTEMPTS", 6))
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+IDLE_DISCONNECT_SECONDS = 60.0
+# A claimed message is left to its sender for this long (then it's due again, should that sender have died)
+CLAIM_SECONDS = 300.0
+
+
+class MailSpool:
+    """Durable FIFO of outgoing messages"""
+
+    def __init__(self, path=SPOOL_PATH, dead_letter_path=DEAD_LETTER_PATH):
+        self.path = path
+        self.dead_letter_path = dead_letter_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "raw TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt REAL NOT NULL, "
+                "created REAL NOT NULL, "
+                "last_error TEXT)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # a queued message must survive a crash
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, msg):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (raw, next_attempt, created) VALUES (?, ?, ?)",
+                (msg.as_string(), now, now)
+            )
+        return cursor.lastrowid
+
+    def claim_due(self, limit=50):
+        """
+        Claim the messages whose next attempt is due, oldest first:
+        [(id, raw, attempts)]. Several processes can drain one spool (the
+        pre-forked server runs a sender per worker), so each row is taken
+        with a conditional UPDATE, and only the sender that changed it
+        sends it.
+        """
+        now = time.time()
+        claimed = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, raw, attempts FROM messages WHERE next_attempt <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    "UPDATE messages SET next_attempt = ? WHERE id = ? AND next_attempt <= ?",
+                    (now + CLAIM_SECONDS, row[0], now)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(row)
+        return claimed
+
+    def next_due_in(self):
+        """Seconds until the next message is due, or None if the spool is empty"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN(next_attempt) FROM messages").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def mark_sent(self, message_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def mark_failed(self, message_id, attempts, error, permanent=False):
+        """Schedule a retry with jittered backoff, or dead-letter the message"""
+        if permanent or attempts >= MAX_ATTEMPTS:
+            self._dead_letter(message_id, attempts, error)
+            return
+
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.5)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE messages SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, str(error), message_id)
+            )
+
+    def _dead_letter(self, message_id, attempts, error):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT raw, created FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+            if row is None:
+                return
+            entry = {
+                "id": message_id,
+                "created": row[1],
+                "failed": time.time(),
+                "attempts": attempts,
+                "error": str(error),
+                "raw": row[0],
+            }
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+        print(f"Email {message_id} moved to dead letters after {attempts} attempts: {error}")
+
+    def discard(self, message_id):
+        """Drop a message without sending it"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def pending(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def is_permanent_failure(error):
+    """5xx replies to the message itself (bad recipient, rejected content) won't succeed on retry"""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False  # our credentials, not the message
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Nothing refused means there was nobody to send to: our configuration, not the message
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    return getattr(error, "smtp_code", 0) >= 500
+
+
+class SMTPSender:
+    """Background worker that drains a MailSpool over one reused SMTP connection"""
+
+    def __init__(self, spool, host=None, port=None, username=None, password=None,
+                 starttls=None, auth=None, smtp_factory=smtplib.SMTP):
+        self.spool = spool
+        self.host = host or os.getenv("SMTP_SERVER")
+        self.port = int(port or os.getenv("SMTP_PORT") or 587)
+        self.username = username if username is not None else os.getenv("EMAIL_USERNAME")
+        self.password = password if password is not None else os.getenv("EMAIL_PASSWORD")
+        if starttls is None:
+            starttls = os.getenv("SMTP_STARTTLS", "1") != "0"
+        self.starttls = starttls
+        if auth is None:
+            auth = os.getenv("SMTP_AUTH", "1") != "0"
+        self.auth = auth
+        self.smtp_factory = smtp_factory
+        self._server = None
+        self._last_used = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        server = self.smtp_factory(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.auth and self.username:
+            server.login(self.username, self.password)
+        return server
+
+    def _connection(self):
+        """Reuse the open connection if it is still alive, else reconnect"""
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except OSError:  # includes SMTPException
+                pass
+            self._close()
+        self._server = self._connect()
+        return self._server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except OSError:
+                pass
+            self._server = None
+
+    def _send(self, raw):
+        msg = email.message_from_string(raw)
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Stale connection that passed NOOP; one fresh attempt
+            self._close()
+            self._connection().send_message(msg)
+        self._last_used = time.time()
+
+    def drain(self):
+        """Send everything that is due. Returns the IDs of the messages (sent, failed)."""
+        sent, failed = [], []
+        with self._lock:
+            for message_id, raw, attempts in self.spool.claim_due():
+                try:
+                    self._send(raw)
+                    self.spool.mark_sent(message_id)
+                    sent.append(message_id)
+                except Exception as e:
+                    print(f"Email error (attempt {attempts + 1}): {e}")
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        self._close()  # connection-level failure; start fresh next time
+                    self.spool.mark_failed(message_id, attempts + 1, e, is_permanent_failure(e))
+                    failed.append(message_id)
+        return sent, failed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                print("Email sender error:", e)
+
+            # Sleep until the next retry is due, or until the idle connection should be closed
+            waits = [self.spool.next_due_in()]
+            if self._server is not None:
+                idle = time.time() - self._last_used
+                if idle >= IDLE_DISCONNECT_SECONDS:
+                    self._close()
+                else:
+                    waits.append(IDLE_DISCONNECT_SECONDS - idle)
+            waits = [w for w in waits if w is not None]
+            self._wakeup.wait(min(waits) if waits else None)
+            self._wakeup.clear()
+        self._close()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="smtp-sender", daemon=True)
+            self._thread.start()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify(self):
+        """Wake the sender because a new message was queued"""
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, timeout=10.0):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_spool = None
+_sender = None
+_init_lock = threading.Lock()
+
+
+def get_mailer():
+    """Process-wide (spool, sender) pair"""
+    global _spool, _sender
+    with _init_lock:
+        if _sender is None:
+            _spool = MailSpool()
+            _sender = SMTPSender(_spool)
+    return _spool, _sender
+
+
+def start_mailer():
+    """Run the background sender in this long-lived process; it starts by sending what the spool holds"""
+    spool, sender = get_mailer()
+    sender.start()
+    pending = spool.pending()
+    if pending:
+        print(f"📬 Resuming delivery of {pending} queued email(s)")
+    return spool, sender
+
+
+def deliver(msg):
+    """
+    Queue `msg`. With a background sender running it is woken up; otherwise
+    the spool is drained inline, because nothing would send it later.
+    Returns False when the message was sent inline and failed; it is then
+    dropped, since the caller reports the failure instead.
+    """
+    if not msg["To"]:
+        raise ValueError("Email has no recipient (is EMAIL_USERNAME set?)")
+    spool, sender = get_mailer()
+    message_id = spool.enqueue(msg)
+    if sender.running():
+        sender.notify()
+        return True
+    try:
+        sent, _ = sender.drain()
+    finally:
+        sender._close()
+    if message_id in sent:
+        return True
+    spool.discard(message_id)
+    return False
+
+
+def stop_mailer(timeout=10.0):
+    """Stop the background sender, if this process started one; queued mail stays in the spool"""
+    with _init_lock:
+        sender = _sender
+    if sender is not None:
+        sender.stop(timeout)
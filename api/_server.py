@@ -0,0 +1,486 @@
+"""
+Local production-style server for the whole site.
+
+Vercel runs each api/*.py handler as its own function; this serves the
+same handlers from one long-lived process, along with index.html and
+static/:
+
+    python -m api._server --port 8000 --workers 16 --queue 64
+
+Connections are accepted by one thread and handed to a fixed pool of
+workers through a bounded queue. When the queue is full the connection
+gets an immediate 503 with Retry-After instead of waiting behind
+requests that will time out anyway. Connections are kept alive between
+requests (each request is routed on its own) for up to KEEPALIVE_SECONDS
+of idleness, but only while no other connection is waiting for a worker.
+The contact mail sender runs for the life of the process, starting with
+whatever an earlier run left in the spool. SIGTERM/SIGINT stop accepting,
+let queued and in-flight requests finish (up to --drain seconds), and
+stop the mail sender.
+
+Once the asset build (api/_assets.py) has written dist/, the site is
+served from there: hashed files with immutable cache headers, and the
+.br/.gz sibling of a file to clients that accept it. --build runs the
+(incremental) build before serving.
+
+With --processes N the server pre-forks: the parent binds the socket and
+builds the Chatbot once, lays its data out for copy-on-write sharing
+(chatbot/prefork.py), then forks N workers that accept on the shared
+socket. The parent restarts workers that die, forwards SIGTERM/SIGINT,
+and logs each worker's unique memory (USS) every --memory-report seconds.
+Sessions default to the SQLite store in this mode, so a conversation
+continues whichever worker takes the next turn.
+
+The leading underscore keeps Vercel from exposing this module as an endpoint.
+"""
+import argparse
+import json
+import os
+import queue
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from api._assets import BUILD_DIR, build, cache_control, load_manifest
+
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 16))
+SERVER_QUEUE = int(os.getenv("SERVER_QUEUE", 64))
+SERVER_DRAIN_SECONDS = float(os.getenv("SERVER_DRAIN_SECONDS", 30))
+SOCKET_TIMEOUT = float(os.getenv("SERVER_SOCKET_TIMEOUT", 30))
+KEEPALIVE_SECONDS = float(os.getenv("SERVER_KEEPALIVE_SECONDS", 5))
+# How often an idle keep-alive connection checks whether its worker is wanted elsewhere
+KEEPALIVE_POLL_SECONDS = 0.05
+SERVER_PROCESSES = int(os.getenv("SERVER_PROCESSES", 1))
+MEMORY_REPORT_SECONDS = float(os.getenv("SERVER_MEMORY_REPORT_SECONDS", 60))
+MAX_REQUEST_LINE = 8192
+BUSY_BODY = json.dumps({"success": False, "response": "The server is busy. Please try again in a moment."})
+
+
+def api_routes():
+    """Path -> handler class, imported here so the server starts the chatbot pre-warm"""
+    from api import chat, contact, test
+
+    return {"/api/chat": chat.handler, "/api/contact": contact.handler, "/api/test": test.handler}
+
+
+class StaticHandler(SimpleHTTPRequestHandler):
+    """index.html and static/ only: the rest of the tree (api/, chatbot/, .env) is never served"""
+
+    protocol_version = "HTTP/1.1"  # files and errors carry Content-Length, so keep-alive is safe
+    precompressed = (("br", ".br"), ("gzip", ".gz"))
+    cache_control = None
+    vary = False
+
+    def translate_path(self, path):
+        """
+        The file for `path`, or "" unless it is index.html or inside static/.
+        Checked on the resolved filesystem path: the URL is still
+        percent-encoded here, so "/static/%2e%2e/..." would pass a prefix test.
+        """
+        path = path.split("?", 1)[0].split("#", 1)[0]
+        if path == "/":
+            path = "/index.html"
+        resolved = os.path.realpath(super().translate_path(path))
+        root = os.path.realpath(self.directory)
+        if resolved == os.path.join(root, "index.html"):
+            return resolved
+        if resolved.startswith(os.path.join(root, "static") + os.sep):
+            return resolved
+        return ""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not path:
+            self.send_error(404, "Not found")
+            return None
+        if os.path.isfile(path):
+            self.cache_control = cache_control(path)
+            variants = [(encoding, path + suffix) for encoding, suffix in self.precompressed
+                        if os.path.isfile(path + suffix)]
+            self.vary = bool(variants)
+            accept = self.headers.get("Accept-Encoding", "")
+            for encoding, variant in variants:
+                if encoding in accept:
+                    return self._send_variant(path, variant, encoding)
+        return super().send_head()
+
+    def _send_variant(self, path, variant, encoding):
+        """The precompressed copy of `path`, labelled with the original's type"""
+        f = open(variant, "rb")
+        stat = os.fstat(f.fileno())
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        return f
+
+    def end_headers(self):
+        if self.cache_control:
+            self.send_header("Cache-Control", self.cache_control)
+        if self.vary:
+            self.send_header("Vary", "Accept-Encoding")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Connection:
+    """A client socket and its buffered files, kept across the requests made on it"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.wfile = sock.makefile("wb")
+        self.request_line = b""
+
+    def close(self):
+        for f in (self.wfile, self.rfile):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+class OneRequest:
+    """
+    Mixin for a handler class: serve the single request whose line the
+    server already read, on the connection's files, and leave them open.
+    The rest is BaseHTTPRequestHandler.handle_one_request.
+    """
+
+    def setup(self):
+        self.connection = self.request.sock
+        self.rfile = self.request.rfile
+        self.wfile = self.request.wfile
+        self.close_connection = True
+
+    def handle(self):
+        self.raw_requestline = self.request.request_line
+        if len(self.raw_requestline) > MAX_REQUEST_LINE:
+            self.requestline = self.request_version = self.command = ""
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        method = getattr(self, "do_" + self.command, None)
+        if method is None:
+            self.send_error(501, f"Unsupported method ({self.command!r})")
+            return
+        method()
+
+    def finish(self):
+        self.wfile.flush()
+
+
+class SiteServer(HTTPServer):
+    """
+    HTTPServer with a bounded worker pool in place of a thread per
+    connection. Every request on a connection is routed by its request
+    line, so the api handlers run unchanged. The pool starts with start(),
+    so a pre-forking parent can bind the socket without starting threads.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, address, routes, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE, static_root=ROOT):
+        super().__init__(address, StaticHandler)
+        # Handler classes serve one request each (see OneRequest); the server loops over the connection
+        self.routes = {path: type(cls.__name__, (OneRequest, cls), {}) for path, cls in routes.items()}
+        self.static_handler = partial(type("StaticHandler", (OneRequest, StaticHandler), {}), directory=str(static_root))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {"accepted": 0, "rejected": 0, "served": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._draining = threading.Event()
+        self.workers = workers
+        self._workers = []
+
+    def start(self):
+        self._workers = [
+            threading.Thread(target=self._work, name=f"site-worker-{i}", daemon=True) for i in range(self.workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def process_request(self, request, client_address):
+        """Runs on the accept thread: queue the connection, or shed it"""
+        try:
+            self.queue.put_nowait((request, client_address))
+            self._count("accepted")
+        except queue.Full:
+            self._count("rejected")
+            self._reject(request)
+
+    def _reject(self, request):
+        body = BUSY_BODY.encode("utf-8")
+        head = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            request.settimeout(1.0)
+            request.sendall(head.encode("latin-1") + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                request, client_address = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.finish_request(request, client_address)
+                self._count("served")
+            except Exception:
+                self._count("errors")
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.queue.task_done()
+
+    def _route(self, request_line):
+        """Handler class for a request line"""
+        parts = request_line.split()
+        path = parts[1].decode("latin-1") if len(parts) >= 2 else "/"
+        return self.routes.get(path.split("?", 1)[0].rstrip("/")) or self.static_handler
+
+    def finish_request(self, request, client_address):
+        """Serve requests on the connection until it closes, idles out or someone else needs the worker"""
+        conn = Connection(request)
+        request.settimeout(SOCKET_TIMEOUT)
+        try:
+            while True:
+                try:
+                    conn.request_line = conn.rfile.readline(MAX_REQUEST_LINE + 1)
+                except (socket.timeout, ConnectionResetError):
+                    return
+                if not conn.request_line:
+                    return
+
+                handler = self._route(conn.request_line)(conn, client_address, self)
+                if handler.close_connection or not self._wait_for_request(conn):
+                    return
+        finally:
+            conn.close()
+
+    def _has_data(self, conn):
+        """Whether the next request has (at least partly) arrived, without blocking"""
+        conn.sock.settimeout(0.0)
+        try:
+            return bool(conn.rfile.peek(1))
+        finally:
+            conn.sock.settimeout(SOCKET_TIMEOUT)
+
+    def _wait_for_request(self, conn):
+        """
+        Wait up to KEEPALIVE_SECONDS for the next request on an idle
+        connection, in short slices so the worker is given up as soon as
+        another connection is queued or the server starts draining.
+        """
+        deadline = time.monotonic() + KEEPALIVE_SECONDS
+        try:
+            while True:
+                # Pipelined requests may already be sitting in the read buffer
+                if self._has_data(conn):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._draining.is_set() or not self.queue.empty():
+                    return False
+                readable, _, _ = select.select([conn.sock], [], [], min(KEEPALIVE_POLL_SECONDS, remaining))
+                # Readable with nothing to read is the client hanging up
+                if readable:
+                    return self._has_data(conn)
+        except OSError:
+            return False
+
+    def handle_error(self, request, client_address):
+        # Visitors closing the tab mid-response are routine
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError, socket.timeout)):
+            super().handle_error(request, client_address)
+
+    def drain(self, timeout=SERVER_DRAIN_SECONDS):
+        """Wait for queued and in-flight requests, then stop the workers. True if everything finished."""
+        self._draining.set()  # no more keep-alive
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        finished = not self.queue.unfinished_tasks
+        self._stopping.set()
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()) + 1.0)
+        return finished
+
+
+def run(server, drain):
+    """Serve until SIGTERM/SIGINT, then drain"""
+    def stop(signum, frame):
+        print(f"🛑 [{os.getpid()}] Received {signal.Signals(signum).name}, finishing in-flight requests...")
+        # shutdown() waits for serve_forever to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    from api._mail_spool import start_mailer, stop_mailer
+    start_mailer()
+
+    server.start()
+    server.serve_forever()
+    server.server_close()  # no new connections from here on
+
+    if server.drain(drain):
+        print(f"✅ [{os.getpid()}] All requests finished")
+    else:
+        print(f"⚠️ [{os.getpid()}] Gave up on {server.queue.unfinished_tasks} request(s) after {drain:.0f}s")
+
+    stop_mailer()
+    print(f"👋 [{os.getpid()}] Stopped ({server.stats})")
+
+
+def _fork_worker(server, chatbot, drain):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        if chatbot is not None:
+            from chatbot.prefork import after_fork
+            after_fork(chatbot)
+        run(server, drain)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _report_memory(children):
+    from chatbot.prefork import memory_usage
+
+    parent = memory_usage()
+    if parent is None:
+        return
+    lines = [f"parent {os.getpid()}: USS {parent['uss']} MB, RSS {parent['rss']} MB"]
+    for pid in sorted(children):
+        usage = memory_usage(pid)
+        if usage:
+            lines.append(f"worker {pid}: USS {usage['uss']} MB, PSS {usage['pss']} MB, "
+                         f"RSS {usage['rss']} MB ({usage['shared']} MB shared)")
+    print("🧠 Memory\n   " + "\n   ".join(lines))
+
+
+def serve_prefork(server, processes, drain, memory_every=MEMORY_REPORT_SECONDS):
+    """Build the Chatbot once, fork `processes` workers and supervise them"""
+    from api.chat import get_chatbot
+
+    chatbot = get_chatbot()
+    if chatbot is None:
+        print("⚠️ Chatbot failed to build in the parent; each worker will build its own")
+    else:
+        from chatbot.prefork import prepare_for_fork
+        prepare_for_fork(chatbot)
+    # Workers that lose the race for a connection must not block in accept()
+    server.socket.setblocking(False)
+
+    children = {_fork_worker(server, chatbot, drain) for _ in range(processes)}
+    print(f"🍴 Forked {processes} workers: {sorted(children)}")
+
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            print(f"🛑 Received {signal.Signals(signum).name}, stopping {len(children)} workers...")
+        stopping.set()
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.monotonic() + min(5.0, memory_every) if memory_every else None
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+            if not stopping.is_set():
+                print(f"💥 Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), starting a new one")
+                children.add(_fork_worker(server, chatbot, drain))
+            continue
+        if next_report and time.monotonic() >= next_report and not stopping.is_set():
+            _report_memory(children)
+            next_report = time.monotonic() + memory_every
+        time.sleep(0.2)
+
+    server.server_close()
+    print("👋 All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the portfolio site and its API locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="threads per process")
+    parser.add_argument("--queue", type=int, default=SERVER_QUEUE, help="connections waiting for a worker")
+    parser.add_argument("--drain", type=float, default=SERVER_DRAIN_SECONDS, help="seconds to finish requests on shutdown")
+    parser.add_argument("--processes", type=int, default=SERVER_PROCESSES, help="pre-forked worker processes")
+    parser.add_argument("--build", action="store_true", help="build the static assets into dist/ first")
+    parser.add_argument("--memory-report", type=float, default=MEMORY_REPORT_SECONDS,
+                        help="seconds between worker memory reports (0 disables)")
+    args = parser.parse_args()
+
+    if args.build:
+        manifest = build()
+        print(f"📦 Assets: built {len(manifest['built'])}, {len(manifest['skipped'])} unchanged")
+    static_root = BUILD_DIR if load_manifest() else ROOT
+    print(f"🗂️ Static files from {static_root}")
+
+    if args.processes > 1:
+        # In-memory histories would be per worker, and a visitor's next turn usually lands on another
+        # one; set before api_routes() starts the pre-warm, which creates the session store
+        backend = os.environ.setdefault("CHATBOT_SESSION_BACKEND", "sqlite")
+        if backend.lower() != "sqlite":
+            print(f"⚠️ CHATBOT_SESSION_BACKEND={backend} with {args.processes} processes: "
+                  "each worker keeps its own conversation histories")
+
+    server = SiteServer((args.host, args.port), api_routes(), args.workers, args.queue, static_root)
+    print(f"🌐 Serving on http://{args.host}:{args.port} "
+          f"({args.processes} process(es) x {args.workers} threads, queue of {args.queue})")
+    if args.processes > 1:
+        serve_prefork(server, args.processes, args.drain, args.memory_report)
+    else:
+        run(server, args.drain)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,8 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import sys
 import os
+import threading
+import time
 from pathlib import Path
-from dotenv import load_dotenv
 
 print("loading chat.py")
 
@@ -11,82 +10,213 @@ print("loading chat.py")
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 
-# Load environment variables for chatbot dependencies
-load_dotenv(ROOT / ".env.local")
-load_dotenv(ROOT / ".env")
-load_dotenv(ROOT / "chatbot/.env")
-load_dotenv()
+from api._http import APIHandler, RequestError, dumps
+from chatbot.metrics import METRICS, PROFILE_HEADER, profile_requested, profiled, should_profile
 
-# Lazy-loaded chatbot instance
+# Chatbot singleton, built once in a background thread
 _chatbot_instance = None
-
-
-def get_chatbot():
-    """Lazy-load the Chatbot instance on first request"""
-    global _chatbot_instance
+_init_lock = threading.Lock()
+_init_thread = None
+_init_state = {"ready": False, "stage": "pending", "stages": {}, "error": None}
+
+WARMING_UP_RESPONSE = "I'm just waking up and will be ready in a few seconds. Please ask me again shortly!"
+
+# BM25-only responder used while the Chatbot warms up (False: unavailable)
+_lexical_responder = None
+_lexical_lock = threading.Lock()
+
+
+def _load_env():
+    """Load environment variables for chatbot dependencies (only needed to build the Chatbot)"""
+    from dotenv import load_dotenv
+    load_dotenv(ROOT / ".env.local")
+    load_dotenv(ROOT / ".env")
+    load_dotenv(ROOT / "chatbot/.env")
+    load_dotenv()
+
+
+def _record_stage(stage):
+    """Progress callback: close the running stage and start the next one"""
+    now = time.time()
+    previous = _init_state["stage"]
+    if previous in _init_state["stages"]:
+        entry = _init_state["stages"][previous]
+        entry.update(status="done", seconds=round(now - entry["started"], 3))
+    if stage != "ready":
+        _init_state["stages"][stage] = {"status": "running", "started": now}
+    _init_state["stage"] = stage
+
+
+def _build_chatbot():
+    global _chatbot_instance, _init_thread
+    print("Initializing Chatbot...")
+    try:
+        _load_env()
+        token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+        if not token:
+            print("Chatbot init warning: HUGGINGFACEHUB_API_TOKEN missing")
+        from chatbot.chat import Chatbot
+        # Loads the persisted index; only re-embeds when its key is stale
+        _chatbot_instance = Chatbot(
+            context_dir=str(ROOT / "chatbot/context"),
+            index_dir=os.getenv("CHATBOT_INDEX_DIR", str(ROOT / "chatbot/index")),
+            progress=_record_stage
+        )
+        _init_state["ready"] = True
+    except Exception as e:
+        print("Chatbot import/init error:", e)
+        _init_state.update(stage="failed", error=str(e))
+        with _init_lock:
+            _init_thread = None  # let the next request try again
+
+
+def start_prewarm():
+    """Start building the Chatbot in the background; only one build ever runs at a time"""
+    global _init_thread
+    with _init_lock:
+        if _init_thread is None and _chatbot_instance is None:
+            _init_state.update(stage="starting", error=None)
+            _init_thread = threading.Thread(target=_build_chatbot, name="chatbot-prewarm", daemon=True)
+            _init_thread.start()
+
+
+def get_chatbot(timeout=None):
+    """
+    The Chatbot instance, or None if it isn't ready within `timeout` seconds
+    (None waits for the build to finish).
+    """
     if _chatbot_instance is None:
-        print("Initializing Chatbot...")
-        try:
-            token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
-            if not token:
-                print("Chatbot init warning: HUGGINGFACEHUB_API_TOKEN missing")
-            from chatbot.chat import Chatbot
-            _chatbot_instance = Chatbot()
-        except Exception as e:
-            print("Chatbot import/init error:", e)
-            raise e
+        start_prewarm()
+        thread = _init_thread
+        if thread is not None:
+            thread.join(timeout)
     return _chatbot_instance
 
 
-class handler(BaseHTTPRequestHandler):
+def get_lexical_responder():
+    """The warm-up LexicalResponder, or None when there is no persisted index to read"""
+    global _lexical_responder
+    with _lexical_lock:
+        if _lexical_responder is None:
+            try:
+                _load_env()
+                from chatbot.chat import LexicalResponder
+                _lexical_responder = LexicalResponder(
+                    os.getenv("CHATBOT_INDEX_DIR", str(ROOT / "chatbot/index"))
+                )
+            except Exception as e:
+                print("Lexical responder unavailable:", e)
+                _lexical_responder = False
+    return _lexical_responder or None
+
+
+# Start warming up as soon as the function instance loads
+if os.getenv("CHATBOT_PREWARM", "1") != "0":
+    start_prewarm()
+
+
+class handler(APIHandler):
+    allow_headers = f"Content-Type, Accept, {PROFILE_HEADER}"
 
     def do_GET(self):
-        """Vercel sometimes probes endpoints with GET before POST."""
-        self._send_response(200, {"status": "chat endpoint active"})
+        """
+        Vercel sometimes probes endpoints with GET before POST. Also the
+        metrics surface: JSON by default, Prometheus text with
+        ?format=prometheus (or an Accept header asking for text/plain).
+        """
+        stats = {}
+        if _chatbot_instance is not None:
+            stats["sessions"] = _chatbot_instance.sessions.stats()
+            stats["answer_cache"] = _chatbot_instance.answer_cache.stats()
+            stats["refinement"] = dict(_chatbot_instance.refinement_stats)
+            stats["prompt"] = dict(_chatbot_instance.prompt_stats)
+            stats["singleflight"] = _chatbot_instance.inflight.stats()
+            stats["llm"] = _chatbot_instance.llm.stats()
+            if hasattr(_chatbot_instance.embeddings_model, "stats"):
+                stats["embedding_batches"] = _chatbot_instance.embeddings_model.stats()
+            # This process's memory; under a pre-fork server USS shows what isn't shared
+            from chatbot.prefork import memory_usage
+            stats["memory"] = {"pid": os.getpid(), **(memory_usage() or {})}
+
+        if "format=prometheus" in self.path or "text/plain" in self.headers.get("Accept", ""):
+            body = METRICS.prometheus({"ready": {"value": _init_state["ready"]}, **stats}).encode("utf-8")
+            return self.send_body(200, body, "text/plain; version=0.0.4; charset=utf-8", "no-cache")
+
+        status = {"status": "chat endpoint active", "ready": _init_state["ready"], "init": _init_state, **stats}
+        status["metrics"] = METRICS.snapshot()
+        # Revalidated every time, but an unchanged status costs a 304
+        self.send_json(200, status, cache_control="no-cache")
 
     def do_POST(self):
         try:
-            # Parse JSON body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
-            data = json.loads(body.decode("utf-8"))
+            data = self.read_json()
 
             message = data.get("message", "")
+            session_id = str(data.get("session_id") or "")[:64] or None
             if not message:
-                return self._send_response(400, {
+                return self.send_json(400, {
                     "success": False,
                     "response": "Message is required"
                 })
 
-            chatbot = get_chatbot()
-            response_text = chatbot.get_response(message)
+            chatbot = get_chatbot(timeout=0)
+            if chatbot is None:
+                # Still warming up: answer right away from BM25 retrieval
+                # instead of holding the request
+                responder = get_lexical_responder()
+                response_text = responder.get_response(message) if responder else WARMING_UP_RESPONSE
+                return self.send_json(200, {
+                    "success": True,
+                    "response": response_text,
+                    "degraded": True
+                })
+
+            # Opt-in streaming: {"stream": true} or Accept: text/event-stream
+            accept = self.headers.get("Accept", "")
+            if data.get("stream") or "text/event-stream" in accept:
+                return self._stream_response(chatbot, message, session_id)
 
-            self._send_response(200, {
-                "success": True,
-                "response": response_text
-            })
+            # cProfile this request when asked to (with the token) or sampled
+            with profiled(should_profile(self.headers.get(PROFILE_HEADER))) as profile:
+                response_text = chatbot.get_response(message, session_id)
 
+            result = {"success": True, "response": response_text}
+            if "profile" in profile:
+                print(f"🔬 Profile of a chat request:\n{profile['profile']}")
+                if profile_requested(self.headers.get(PROFILE_HEADER)):
+                    result["profile"] = profile["profile"]
+            self.send_json(200, result)
+
+        except RequestError as e:
+            self.send_json(e.status, {"success": False, "response": str(e)})
         except Exception as e:
             print("Chat error:", e)
-            self._send_response(500, {
+            self.send_json(500, {
                 "success": False,
                 "response": "Server error"
             })
 
-    def do_OPTIONS(self):
-        """Handle CORS preflight"""
-        self.send_response(200)
-        self._cors()
-        self.end_headers()
-
-    def _cors(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-
-    def _send_response(self, status, data):
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json")
-        self._cors()
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode("utf-8"))
\ No newline at end of file
+    def _stream_response(self, chatbot, message, session_id):
+        """Send the answer as Server-Sent Events, flushing each token as it arrives"""
+        self.start_stream()
+
+        try:
+            try:
+                for event, text in chatbot.stream_response(message, session_id):
+                    self._send_event(event, text)
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                # The 200 and its headers are already out: report the error inside the stream
+                from chatbot.chat import ERROR_RESPONSE
+
+                print("Chat stream error:", e)
+                self._send_event("replace", ERROR_RESPONSE)
+                self._send_event("done", ERROR_RESPONSE)
+        except (BrokenPipeError, ConnectionResetError):
+            print("Chat stream: client disconnected")
+
+    def _send_event(self, event, text):
+        payload = {"response": text} if event == "done" else {"text": text}
+        self.wfile.write(b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(payload) + b"\n\n")
+        self.wfile.flush()
@@ -1,7 +1,5 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import os
-import smtplib
+import sys
 from pathlib import Path
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
@@ -10,13 +8,22 @@ print("loading contact.py")
 
 # Ensure .env loads in vercel dev
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
 load_dotenv(ROOT / ".env.local")  # works for local dev
 load_dotenv(ROOT / ".env")        # works for deployed env
 load_dotenv(ROOT / "chatbot/.env")  # legacy location for secrets
 load_dotenv()                     # fallback
 
+from api._http import APIHandler, RequestError
+from api._mail_spool import deliver
+
 
 def send_email(first, last, email, subject, message):
+    """
+    Persist the email to the spool; the background sender (or, without one,
+    this request) delivers it. False when it can't be queued or, sent inline,
+    wasn't delivered.
+    """
     try:
         body = f"""{message}
 
@@ -29,27 +36,20 @@ Best regards,
         msg["From"] = email
         msg["To"] = os.getenv("EMAIL_USERNAME")
 
-        server = smtplib.SMTP(os.getenv("SMTP_SERVER"), int(os.getenv("SMTP_PORT")))
-        server.starttls()
-        server.login(os.getenv("EMAIL_USERNAME"), os.getenv("EMAIL_PASSWORD"))
-        server.send_message(msg)
-        server.quit()
-
-        return True
+        return deliver(msg)
     except Exception as e:
         print("Email error:", e)
         return False
 
 
-class handler(BaseHTTPRequestHandler):
+class handler(APIHandler):
 
     def do_GET(self):
-        self._send_response(200, {"status": "contact endpoint active"})
+        self.send_json(200, {"status": "contact endpoint active"}, cache_control="no-cache")
 
     def do_POST(self):
         try:
-            length = int(self.headers.get("Content-Length", 0))
-            data = json.loads(self.rfile.read(length).decode("utf-8"))
+            data = self.read_json()
 
             first = data.get("firstName", "")
             last = data.get("lastName", "")
@@ -58,7 +58,7 @@ class handler(BaseHTTPRequestHandler):
             message = data.get("message", "")
 
             if not all([first, last, email, subject, message]):
-                return self._send_response(400, {
+                return self.send_json(400, {
                     "success": False,
                     "message": "All fields are required"
                 })
@@ -66,36 +66,21 @@ class handler(BaseHTTPRequestHandler):
             success = send_email(first, last, email, subject, message)
 
             if success:
-                self._send_response(200, {
+                self.send_json(200, {
                     "success": True,
                     "message": "Thank you for your message! I'll get back to you soon."
                 })
             else:
-                self._send_response(500, {
+                self.send_json(500, {
                     "success": False,
                     "message": "Failed to send email"
                 })
 
+        except RequestError as e:
+            self.send_json(e.status, {"success": False, "message": str(e)})
         except Exception as e:
             print("Contact error:", e)
-            self._send_response(500, {
+            self.send_json(500, {
                 "success": False,
                 "message": "Server error"
             })
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self._cors()
-        self.end_headers()
-
-    def _cors(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-
-    def _send_response(self, status, data):
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json")
-        self._cors()
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode("utf-8"))
\ No newline at end of file
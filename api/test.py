@@ -1,9 +1,11 @@
-from http.server import BaseHTTPRequestHandler
+import sys
+from pathlib import Path
 
-class handler(BaseHTTPRequestHandler):
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api._http import APIHandler
+
+
+class handler(APIHandler):
     def do_GET(self):
-        self.send_response(200)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(b'{"ok": true, "message": "hello from Python"}')
-        return
\ No newline at end of file
+        self.send_json(200, {"ok": True, "message": "hello from Python"})
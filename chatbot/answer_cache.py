@@ -0,0 +1,100 @@
+"""
+Semantic answer cache in front of the LLM call.
+
+Most chat traffic is a handful of near-duplicate questions. The cache keeps
+the (unit-normalized) query embeddings of past questions in one NumPy matrix
+and answers a new question with a single matvec: if the best cosine
+similarity clears the threshold, the stored answer is reused.
+
+Entries expire after an idle TTL, the least recently used slot is recycled
+when the matrix is full, and everything is dropped when the context index
+version changes (answers built from stale context must not be served).
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+
+CACHE_THRESHOLD = float(os.getenv("CHATBOT_CACHE_THRESHOLD", 0.92))
+CACHE_SIZE = int(os.getenv("CHATBOT_CACHE_SIZE", 256))  # 0 disables the cache
+CACHE_TTL = float(os.getenv("CHATBOT_CACHE_TTL", 60 * 60))
+
+
+class SemanticCache:
+    def __init__(self, threshold=CACHE_THRESHOLD, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._reset(dim=0)
+
+    def _reset(self, dim):
+        self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._last_used = np.full(self.max_entries, -np.inf)
+        self._answers = [None] * self.max_entries
+        self._questions = [None] * self.max_entries
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version, dim):
+        """Drop everything when the index version or embedding size changes"""
+        if version != self.version or self._matrix.shape[1] != dim:
+            if self.version is not None:
+                print("🧹 Context index changed, clearing answer cache")
+            self.version = version
+            self._reset(dim)
+
+    def lookup(self, embedding, version):
+        """Return a cached answer for a similar question, or None"""
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._check_version(version, vector.shape[0])
+
+            # Expired or empty slots must never match
+            live = self._last_used >= now - self.ttl
+            if live.any():
+                scores = np.where(live, self._matrix @ vector, -np.inf)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._last_used[best] = now
+                    self.hits += 1
+                    return self._answers[best]
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding, answer, version, question=None):
+        if not self.max_entries:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version, vector.shape[0])
+            slot = int(np.argmin(self._last_used))  # empty slots are -inf, so they go first
+            if self._answers[slot] is not None:
+                self.evictions += 1
+            self._matrix[slot] = vector
+            self._last_used[slot] = time.time()
+            self._answers[slot] = answer
+            self._questions[slot] = question
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": sum(a is not None for a in self._answers),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
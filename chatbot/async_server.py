@@ -0,0 +1,138 @@
+"""
+Local asyncio server for the chatbot.
+
+Serves the same /api/chat contract as api/chat.py, but every connection is
+a coroutine instead of a thread, so one process can hold many concurrent
+chats while they wait on the LLM. Usage:
+
+    python -m chatbot.async_server --port 8001
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from chatbot.chat import REQUEST_TIMEOUT, Chatbot
+from chatbot.metrics import METRICS
+
+
+MAX_BODY_BYTES = 64 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+
+class AsyncChatServer:
+    def __init__(self, chatbot, timeout=REQUEST_TIMEOUT):
+        self.chatbot = chatbot
+        self.timeout = timeout
+
+    async def _write_response(self, writer, status, data=None, keep_alive=True):
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **CORS_HEADERS,
+        }
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    async def _handle_request(self, method, path, body):
+        """Returns (status, payload)"""
+        if path.split("?")[0].rstrip("/") != "/api/chat":
+            return 404, {"success": False, "response": "Not found"}
+        if method == "GET":
+            return 200, {"status": "chat endpoint active", "metrics": METRICS.snapshot()}
+        if method == "OPTIONS":
+            return 200, None
+        if method != "POST":
+            return 404, {"success": False, "response": "Not found"}
+
+        try:
+            data = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return 400, {"success": False, "response": "Invalid JSON"}
+
+        message = data.get("message", "")
+        if not message:
+            return 400, {"success": False, "response": "Message is required"}
+        session_id = str(data.get("session_id") or "")[:64] or None
+
+        response_text = await self.chatbot.aget_response(message, session_id, timeout=self.timeout)
+        return 200, {"success": True, "response": response_text}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self._write_response(writer, 400, {"success": False}, keep_alive=False)
+                    break
+                method, path, version = parts
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._write_response(writer, 413, {"success": False}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await self._handle_request(method, path, body)
+                except Exception as e:
+                    print("Chat error:", e)
+                    status, payload = 500, {"success": False, "response": "Server error"}
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port):
+    loop = asyncio.get_running_loop()
+    # Model loading is blocking; keep the event loop free while it runs
+    chatbot = await loop.run_in_executor(None, Chatbot)
+    server = await asyncio.start_server(AsyncChatServer(chatbot).handle_connection, host, port)
+    print(f"🚀 Async chat server on http://{host}:{port}/api/chat")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot on a local asyncio server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
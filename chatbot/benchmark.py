@@ -0,0 +1,269 @@
+"""
+Offline latency/throughput benchmark for the chat pipeline.
+
+Builds a Chatbot over the fixture corpus in chatbot/bench/corpus, points
+it at an in-process stub inference server (see stub_inference.py) and
+replays chatbot/bench/questions.txt at the requested concurrency:
+
+    python -m chatbot.benchmark --requests 200 --concurrency 8 --llm-latency 0.3 \\
+        --fake-embeddings --output bench.json
+    python -m chatbot.benchmark ... --baseline bench.json   # exit 1 on p95 regressions
+
+Reported stages, each with count/mean/p50/p95/p99/max in milliseconds:
+
+    build:     load, split, embed, index      (cold index build, --build-repeats times)
+    requests:  embed_query, retrieve, prompt_build, llm, guardrail,
+               local_repair, refinement, total   (one sample per call)
+
+Nested stages aren't double counted: the LLM call made by a refinement
+is part of "refinement", not "llm". The answer cache and request
+coalescing are off unless --cache is given, so every request pays for
+the full pipeline. Prompt tokens are estimated from length unless
+--tokenizer points at a tokenizer.json, so nothing touches the network.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+BENCH_DIR = ROOT / "chatbot" / "bench"
+CORPUS_DIR = BENCH_DIR / "corpus"
+QUESTIONS_FILE = BENCH_DIR / "questions.txt"
+BUILD_STAGES = ("load", "split", "embed", "index")
+REQUEST_STAGES = (
+    "embed_query", "retrieve", "prompt_build", "llm", "guardrail", "local_repair", "refinement", "total"
+)
+
+
+class StageRecorder:
+    """Collects per-stage durations; a stage called inside another recorded stage isn't recorded"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            if getattr(self._local, "active", False):
+                return func(*args, **kwargs)
+            self._local.active = True
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.active = False
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self, stages):
+        return {stage: summarize(self.samples[stage]) for stage in stages if self.samples.get(stage)}
+
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": int(ms.size),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def bench_build(corpus_dir, embeddings, recorder, repeats, chunk_size, chunk_overlap, dtype):
+    """Time the cold index build stage by stage"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import TextLoader
+
+    from chatbot.index_store import context_files
+    from chatbot.retrieval import HybridRetriever
+    from chatbot.vector_store import CompactVectorStore
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    paths = context_files(corpus_dir)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        docs = [doc for path in paths for doc in TextLoader(str(path)).load()]
+        recorder.add("load", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        chunks = splitter.split_documents(docs)
+        recorder.add("split", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+        recorder.add("embed", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as index_dir:
+            ids = [f"chunk#{i}" for i in range(len(chunks))]
+            store = CompactVectorStore.from_embeddings(chunks, ids, vectors, dtype)
+            store.save_local(index_dir)
+            HybridRetriever(store)
+        recorder.add("index", time.perf_counter() - start)
+    return len(paths), len(chunks)
+
+
+def instrument(bot, recorder):
+    """Wrap the Chatbot's stage methods (on the instance only) with timers"""
+    bot._embed_query = recorder.wrap("embed_query", bot._embed_query)
+    bot.retriever.search_with_scores = recorder.wrap("retrieve", bot.retriever.search_with_scores)
+    bot.prompt_builder.build = recorder.wrap("prompt_build", bot.prompt_builder.build)
+    bot.llm_wrapper = recorder.wrap("llm", bot.llm_wrapper)
+    bot.check_meta_commentary_similarity = recorder.wrap("guardrail", bot.check_meta_commentary_similarity)
+    bot.guardrail.repair = recorder.wrap("local_repair", bot.guardrail.repair)
+    bot.refine_response = recorder.wrap("refinement", bot.refine_response)
+
+
+def replay(bot, questions, recorder, total, concurrency):
+    """
+    Ask `total` questions (cycling through the workload), each in a fresh
+    session. get_response answers failures with a canned message rather
+    than raising, so those messages are what gets counted as errors.
+    """
+    from chatbot.chat import ERROR_RESPONSE, LLM_ERROR_RESPONSE, TIMEOUT_RESPONSE
+
+    failures = {ERROR_RESPONSE, LLM_ERROR_RESPONSE, TIMEOUT_RESPONSE}
+    errors = []
+
+    def ask(i):
+        start = time.perf_counter()
+        try:
+            response = bot.get_response(questions[i % len(questions)], session_id=f"bench-{i}")
+            if response in failures:
+                errors.append(response)
+        except Exception as e:
+            errors.append(repr(e))
+        recorder.add("total", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(ask, range(total)))
+    return time.perf_counter() - start, errors
+
+
+def compare(results, baseline, tolerance):
+    """p95 regressions beyond `tolerance` (fraction) against a previous run"""
+    regressions = []
+    for section in ("build", "requests"):
+        for stage, stats in results[section].items():
+            old = baseline.get(section, {}).get(stage)
+            if old and old["p95"] > 0 and stats["p95"] > old["p95"] * (1 + tolerance):
+                regressions.append(f"{section}.{stage}: p95 {old['p95']:.1f} -> {stats['p95']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the chat pipeline")
+    parser.add_argument("--corpus", default=str(CORPUS_DIR))
+    parser.add_argument("--questions", default=str(QUESTIONS_FILE))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--build-repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM mean latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-tail-latency", type=float, default=2.0)
+    parser.add_argument("--meta-rate", type=float, default=0.1,
+                        help="fraction of stub answers with meta-commentary (exercises the guardrail)")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use the hashing embedding backend")
+    parser.add_argument("--tokenizer", default="estimate", help="tokenizer.json for counting prompt tokens")
+    parser.add_argument("--cache", action="store_true", help="keep the answer cache and request coalescing on")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="previous --output to compare p95s against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression (fraction)")
+    args = parser.parse_args()
+
+    from chatbot.stub_inference import StubBehaviour, StubInferenceServer
+
+    stub = StubInferenceServer(default=StubBehaviour(
+        latency=args.llm_latency, jitter=args.llm_jitter, tail_rate=args.llm_tail_rate,
+        tail_latency=args.llm_tail_latency, meta_rate=args.meta_rate,
+        answer="I studied Computer Science at Lakeview State University and interned at Harborlight Analytics."
+    )).start()
+
+    # The chatbot modules read these at import time
+    os.environ["CHATBOT_LLM_BASE_URL"] = stub.base_url
+    os.environ["CHATBOT_TOKENIZER_PATH"] = args.tokenizer
+    os.environ["CHATBOT_PREWARM"] = "0"
+    os.environ["CHATBOT_SESSION_BACKEND"] = "memory"
+    if args.fake_embeddings:
+        os.environ["CHATBOT_EMBEDDING_BACKEND"] = "hashing"
+    if not args.cache:
+        os.environ["CHATBOT_CACHE_SIZE"] = "0"
+        os.environ["CHATBOT_COALESCE"] = "0"
+
+    from chatbot.chat import CHUNK_OVERLAP, CHUNK_SIZE, INDEX_DTYPE, Chatbot, load_embeddings
+
+    recorder = StageRecorder()
+    embeddings = load_embeddings()
+    files, chunks = bench_build(
+        args.corpus, embeddings, recorder, args.build_repeats, CHUNK_SIZE, CHUNK_OVERLAP, INDEX_DTYPE
+    )
+
+    questions = [q.strip() for q in Path(args.questions).read_text(encoding="utf-8").splitlines() if q.strip()]
+    with tempfile.TemporaryDirectory() as index_dir:
+        bot = Chatbot(context_dir=args.corpus, index_dir=index_dir)
+        instrument(bot, recorder)
+        wall, errors = replay(bot, questions, recorder, args.requests, args.concurrency)
+    stub.stop()
+
+    results = {
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "embedding_backend": embeddings.name,
+            "files": files,
+            "chunks": chunks,
+        },
+        "build": recorder.summary(BUILD_STAGES),
+        "requests": recorder.summary(REQUEST_STAGES),
+        "throughput_rps": round(args.requests / wall, 2),
+        "wall_seconds": round(wall, 3),
+        "errors": len(errors),
+        "refinement": dict(bot.refinement_stats),
+        "prompt": dict(bot.prompt_stats),
+        "llm": bot.llm.stats(),
+    }
+
+    print(f"\n{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for section in ("build", "requests"):
+        for stage, stats in results[section].items():
+            print(f"{section + '.' + stage:<22}{stats['count']:>7}{stats['p50']:>10.1f}"
+                  f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    print(f"\n🚀 {results['throughput_rps']} requests/s at concurrency {args.concurrency} "
+          f"({args.requests} requests, {len(errors)} errors)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No p95 regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
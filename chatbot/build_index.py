@@ -0,0 +1,100 @@
+"""
+Build the compact index artifact ahead of deploy.
+
+    python -m chatbot.build_index [--dtype int8] [--verify]
+
+Writes the memory-mappable vector file, chunk table, phrase embeddings and
+manifest into CHATBOT_INDEX_DIR (chatbot/index by default), so serving
+instances only have to map them. --verify builds a FAISS index over the
+same chunks and reports how often both return the same top-k.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from chatbot.chat import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    CONTEXT_DIR,
+    INDEX_DIR,
+    INDEX_DTYPE,
+    RETRIEVAL_K,
+    load_embeddings,
+)
+from chatbot.guardrail import load_guardrail_config
+from chatbot.index_store import build_index, compute_index_key, compute_settings_key, file_hashes, save_index
+from chatbot.vector_store import DTYPES, normalize_rows
+
+
+SAMPLE_QUERIES = [
+    "Where did you study?",
+    "What is your education?",
+    "Tell me about your work experience",
+    "What challenges did you face at work?",
+    "Tell me about your family",
+    "What are your hobbies?",
+]
+
+
+def verify_against_faiss(store, embeddings, queries, k=RETRIEVAL_K):
+    """Fraction of top-k chunk IDs shared with FAISS over the same normalized vectors"""
+    import faiss
+
+    vectors = normalize_rows(embeddings.embed_documents(store.texts))
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    overlaps = []
+    for query in queries:
+        query_vector = normalize_rows(embeddings.embed_query(query))
+        _, faiss_top = index.search(query_vector, k)
+        faiss_ids = {store.ids[i] for i in faiss_top[0] if i >= 0}
+        compact_ids = {chunk.id for chunk in store.similarity_search_by_vector(query_vector[0], k)}
+        overlaps.append(len(faiss_ids & compact_ids) / max(1, len(faiss_ids)))
+    return float(np.mean(overlaps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the chatbot's compact vector index")
+    parser.add_argument("--context-dir", default=CONTEXT_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--dtype", choices=DTYPES, default=INDEX_DTYPE)
+    parser.add_argument("--verify", action="store_true", help="compare top-k results with FAISS")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    embeddings = load_embeddings()
+    phrases = load_guardrail_config()["phrases"]
+
+    hashes = file_hashes(args.context_dir)
+    settings_key = compute_settings_key(CHUNK_SIZE, CHUNK_OVERLAP, embeddings.name, phrases, args.dtype)
+    key = compute_index_key(hashes, settings_key)
+
+    store, problematic_embeddings, manifest = build_index(
+        args.context_dir, hashes, embeddings, CHUNK_SIZE, CHUNK_OVERLAP, phrases, args.dtype
+    )
+    if not save_index(args.index_dir, key, store, problematic_embeddings,
+                      settings_key=settings_key, manifest=manifest):
+        sys.exit(1)
+
+    size_kb = store.vectors.nbytes / 1024
+    print(f"✅ {len(store)} chunks x {store.vectors.shape[1]} dims ({embeddings.name}, {args.dtype}, {size_kb:.1f} KB) "
+          f"written to {args.index_dir} in {time.time() - start_time:.2f}s")
+    if args.dtype != INDEX_DTYPE:
+        print(f"ℹ️ Serve it with CHATBOT_INDEX_DTYPE={args.dtype}")
+
+    if args.verify:
+        queries = SAMPLE_QUERIES + store.texts[:20]
+        agreement = verify_against_faiss(store, embeddings, queries)
+        print(f"🔎 Top-{RETRIEVAL_K} agreement with FAISS over {len(queries)} queries: {agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
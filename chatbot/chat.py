@@ -1,92 +1,75 @@
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv("chatbot/.env")
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.prompts import PromptTemplate
 import time
-from sklearn.metrics.pairwise import cosine_similarity
-from huggingface_hub import InferenceClient
-
-
-
-
-
-class Chatbot:
-    def __init__(self):
-        print("🔄 Loading context documents...")
-        start_time = time.time()
-        
-        # Load all text and PDF files from the context directory
-        text_loader = DirectoryLoader(
-            'chatbot/context',
-            glob="**/*.txt",
-            loader_cls=TextLoader
-        )
-        
-        # Load documents from the loader
-        documents = text_loader.load()
-        
-        print(f"📚 Loaded {len(documents)} documents")
-        
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=30)
-        docs = text_splitter.split_documents(documents)
-        
-        print("🔍 Creating embeddings...")
-        # embeddings
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/multi-qa-distilbert-cos-v1",
-            model_kwargs={
-                'device': 'cpu',
-                'token': os.getenv('HUGGINGFACEHUB_API_TOKEN')
-            }
-        )
-
-        docsearch = FAISS.from_documents(docs, embeddings)
-        # Store docsearch as instance variable
-        self.docsearch = docsearch
-        
-        print("🤖 Initializing AI model...")
-        # Define the repo ID and connect to Mixtral model on Huggingface
-        repo_id = "meta-llama/Llama-3.1-8B-Instruct"
-        # # low-level HF client for chat_completion
-        # self.llm = InferenceClient(
-        #     repo_id,
-        #     token=os.getenv("HUGGINGFACE_API_KEY")
-        # )
-        self.llm = InferenceClient(
-            "meta-llama/Llama-3.1-8B-Instruct",
-            token=os.getenv("HUGGINGFACEHUB_API_TOKEN")
-        )
-
-
-        # Store embeddings model for similarity checking
-        self.embeddings_model = embeddings
-        
-        # Store conversation history
-        self.conversation_history = []
-
-        # Create embeddings for problematic meta-commentary phrases
-        self.problematic_phrases = [
-            "based on the documents I have",
-            "according to the context provided to me", 
-            "from the information I've been given",
-            "the documents show that",
-            "based on my knowledge base",
-            "from the context I can see",
-            "according to the sources I have"
-        ]
-
-        # Create embeddings for these phrases
-        self.problematic_embeddings = [
-            self.embeddings_model.embed_query(phrase) 
-            for phrase in self.problematic_phrases
-        ]
-        
-        # prompt template
-        template = """You are Mahendra Kumar, an expert consultant. Answer questions directly and professionally.
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# langchain, torch and huggingface_hub are imported where they are used,
+# so importing this module (or the API handler) stays cheap.
+
+# Allow `python chatbot/chat.py` to import sibling modules as `chatbot.*`
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from chatbot.index_store import (
+    build_index,
+    compute_index_key,
+    compute_settings_key,
+    diff_manifest,
+    file_hashes,
+    load_artifact,
+    save_index,
+    split_files,
+)
+from chatbot.sessions import create_session_store
+from chatbot.answer_cache import SemanticCache
+from chatbot.embeddings import EMBEDDING_BACKEND, create_embeddings
+from chatbot.prompt_builder import PromptBuilder, load_token_counter
+from chatbot.retrieval import HybridRetriever
+from chatbot.singleflight import SingleFlight, SingleFlightAbandoned, SingleFlightTimeout, normalize_question
+from chatbot.guardrail import MetaCommentaryGuard, load_guardrail_config
+from chatbot.metrics import METRICS
+
+
+CONTEXT_DIR = "chatbot/context"
+INDEX_DIR = os.getenv("CHATBOT_INDEX_DIR", "chatbot/index")
+# Chunking and k as chosen with `python -m chatbot.eval_retrieval`
+CHUNK_SIZE = int(os.getenv("CHATBOT_CHUNK_SIZE", 512))
+CHUNK_OVERLAP = int(os.getenv("CHATBOT_CHUNK_OVERLAP", 30))
+INDEX_DTYPE = os.getenv("CHATBOT_INDEX_DTYPE", "float16")  # or int8
+RETRIEVAL_K = int(os.getenv("CHATBOT_RETRIEVAL_K", 4))
+# MMR diversity for the final k chunks (0 keeps the fused ranking as is)
+RETRIEVAL_DIVERSITY = float(os.getenv("CHATBOT_RETRIEVAL_DIVERSITY", 0))
+RETRIEVAL_MODE = os.getenv("CHATBOT_RETRIEVAL_MODE", "hybrid")  # hybrid, dense or lexical
+# Skip the query embedding and retrieve lexically while the 1-minute load
+# average per CPU is above this (0 disables)
+LEXICAL_LOAD = float(os.getenv("CHATBOT_LEXICAL_LOAD", 0))
+
+FALLBACK_RESPONSE = "I'm sorry, I don't have that information."
+LLM_ERROR_RESPONSE = "I'm having trouble connecting to my AI service right now. Please try again in a moment."
+TIMEOUT_RESPONSE = "Sorry, that took too long to answer. Please try again."
+ERROR_RESPONSE = "I'm sorry, I encountered an error. Please try again."
+
+# Async pipeline: CPU-bound embedding/vector search work runs in this many threads
+CPU_WORKERS = int(os.getenv("CHATBOT_CPU_WORKERS", 4))
+REQUEST_TIMEOUT = float(os.getenv("CHATBOT_REQUEST_TIMEOUT", 30))
+
+# Lines of conversation kept per session (to avoid context overflow)
+HISTORY_LINES = 10
+
+# Identical opening questions in flight share one LLM call (set to 0 to disable)
+COALESCE = os.getenv("CHATBOT_COALESCE", "1") != "0"
+
+# Coalesce concurrent embed_query calls into batches (set to 0 to disable)
+EMBED_BATCHING = os.getenv("CHATBOT_EMBED_BATCHING", "1") != "0"
+
+# prompt template
+PROMPT_TEMPLATE = """You are Mahendra Kumar, an expert consultant. Answer questions directly and professionally.
 
 CRITICAL: Never say "based on documents", "according to context", or mention your information/meta-commentary sources.
 
@@ -107,8 +90,8 @@ Question: {question}
 
 Answer directly:"""
 
-        # Refinement prompt for when we detect meta-commentary
-        refinement_template = """Your previous response mentioned your information sources, which isn't needed. Please rewrite your answer to be more direct and professional.
+# Refinement prompt for when we detect meta-commentary
+REFINEMENT_TEMPLATE = """Your previous response mentioned your information sources, which isn't needed. Please rewrite your answer to be more direct and professional.
 
 Original question: {question}
 
@@ -120,21 +103,121 @@ Please provide a refined answer that:
 - States facts as an expert would
 """
 
-        prompt = PromptTemplate(
-            template=template, 
-            input_variables=["context", "question", "conversation_history"]
-        )
 
-        self.refinement_prompt = PromptTemplate(
-            template=refinement_template,
-            input_variables=["question", "previous_response"]
+def _timed_progress(report):
+    """Wrap an init progress callback so each stage's duration also lands in METRICS ("init.<stage>")"""
+    current = {"stage": None, "start": time.perf_counter()}
+
+    def progress(stage):
+        now = time.perf_counter()
+        if current["stage"] is not None:
+            METRICS.observe(f"init.{current['stage']}", now - current["start"])
+        current.update(stage=stage, start=now)
+        report(stage)
+    return progress
+
+
+def load_embeddings():
+    """The embedding backend (CHATBOT_EMBEDDING_BACKEND) used for the index, queries and the guardrail"""
+    return create_embeddings(EMBEDDING_BACKEND)
+
+
+class Chatbot:
+    def __init__(self, context_dir=CONTEXT_DIR, index_dir=INDEX_DIR, progress=None):
+        """
+        `progress`, if given, is called with the name of each init stage as
+        it starts ("imports", "embedding_model", "index", "guardrail",
+        "llm_client") and finally with "ready".
+        """
+        progress = _timed_progress(progress or (lambda stage: None))
+        print("🔄 Loading context documents...")
+        start_time = time.time()
+
+        progress("imports")
+        from chatbot.llm_client import LLMUnavailable, ResilientLLM
+        
+        # embeddings
+        progress("embedding_model")
+        embeddings = load_embeddings()
+
+        if EMBED_BATCHING:
+            from chatbot.embedding_batcher import BatchingEmbeddings
+            embeddings = BatchingEmbeddings(embeddings)
+
+        # Store embeddings model for similarity checking
+        self.embeddings_model = embeddings
+
+        # Phrases that indicate the model is talking about its sources
+        guardrail_config = load_guardrail_config()
+        self.problematic_phrases = list(guardrail_config["phrases"])
+
+        self.context_dir = context_dir
+        self.index_dir = index_dir
+        # The backend name is part of the key, so switching backends rebuilds the index
+        self.settings_key = compute_settings_key(
+            CHUNK_SIZE, CHUNK_OVERLAP, embeddings.name, self.problematic_phrases, INDEX_DTYPE
+        )
+        # Serializes re-indexing; readers never take it
+        self._index_lock = threading.Lock()
+        progress("index")
+        self._load_or_build_index()
+
+        progress("guardrail")
+        self.guardrail = MetaCommentaryGuard(
+            embeddings,
+            self.problematic_phrases,
+            self.problematic_embeddings,
+            threshold=guardrail_config["threshold"],
+            triggers=guardrail_config["triggers"]
         )
+        # How often answers needed fixing, and how they got fixed
+        self.refinement_stats = {
+            "checked": 0,
+            "flagged": 0,
+            "repaired_locally": 0,
+            "refined_remotely": 0,
+            "fallback": 0,
+            "refine_seconds_avg": None,
+            "seconds_saved": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+        
+        print("🤖 Initializing AI model...")
+        progress("llm_client")
+        # Define the repo ID and connect to Mixtral model on Huggingface
+        repo_id = "meta-llama/Llama-3.1-8B-Instruct"
+        # # low-level HF client for chat_completion
+        # self.llm = InferenceClient(
+        #     repo_id,
+        #     token=os.getenv("HUGGINGFACE_API_KEY")
+        # )
+        # Deadlines, retries, hedging and a circuit breaker around InferenceClient
+        # (sync and async); CHATBOT_LLM_* settings, see llm_client.py
+        self.llm = ResilientLLM.from_env()
+        self._executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="chatbot-cpu")
+
+
+        # Conversation history, kept per visitor session
+        self.sessions = create_session_store()
+
+        # Answers to near-duplicate first questions, invalidated with index_key
+        self.answer_cache = SemanticCache()
+
+        # Identical opening questions asked at the same time share one LLM call
+        self.inflight = SingleFlight()
+        
+        # Plain str.format templates: {context}, {question}, {conversation_history}
+        prompt = PROMPT_TEMPLATE
+
+        # {question}, {previous_response}
+        self.refinement_prompt = REFINEMENT_TEMPLATE
 
         def llm_wrapper(prompt_text):
             if hasattr(prompt_text, "to_string"):
                 prompt_text = prompt_text.to_string()
             
             try:
+                METRICS.count("llm_calls")
                 # response = self.llm.chat_completion(
                 #     model="mistralai/Mixtral-8x7B-Instruct-v0.1",
                 #     messages=[{"role": "user", "content": prompt_text}],
@@ -142,51 +225,139 @@ Please provide a refined answer that:
                 #     temperature=0.4,  # Slightly higher for natural responses
                 #     top_p=0.95
                 # )
-                response = self.llm.chat_completion(
-                    messages=[{"role": "user", "content": prompt_text}],
-                    max_tokens=200,
-                    temperature=0.4
-                )
+                with METRICS.span("llm"):
+                    response = self.llm.chat_completion(
+                        messages=[{"role": "user", "content": prompt_text}],
+                        max_tokens=200,
+                        temperature=0.4
+                    )
                 return response.choices[0].message["content"]
+            except LLMUnavailable as e:
+                METRICS.count("llm_errors")
+                print(f"⚡ AI API unavailable: {e}")
+                return LLM_ERROR_RESPONSE
             except Exception as e:
+                METRICS.count("llm_errors")
                 print(f"❌ AI API Error: {e}")
                 import traceback
                 traceback.print_exc()
-                return "I'm having trouble connecting to my AI service right now. Please try again in a moment."
+                return LLM_ERROR_RESPONSE
 
         self.prompt = prompt
+        # Counts prompt tokens with the model's tokenizer and enforces the input budget
+        self.prompt_builder = PromptBuilder(prompt, load_token_counter())
+        self.prompt_stats = {"requests": 0, "prompt_tokens_avg": None, "prompt_tokens_max": 0, "trimmed": 0}
         self.llm_wrapper = llm_wrapper
         
         init_time = time.time() - start_time
+        METRICS.observe("init", init_time)
         print(f"✅ Chatbot initialized in {init_time:.2f} seconds!")
+        progress("ready")
+
+    def _load_or_build_index(self):
+        """Reuse the persisted index, updating it in place when only file contents changed"""
+        hashes = file_hashes(self.context_dir)
+        key = compute_index_key(hashes, self.settings_key)
+        artifact = load_artifact(self.index_dir)
+
+        if artifact is not None and artifact[0].get("settings") == self.settings_key:
+            meta, self.docsearch, self.problematic_embeddings = artifact
+            self.manifest = meta.get("files", {})
+            self.index_key = meta["key"]
+            self.retriever = HybridRetriever(self.docsearch, RETRIEVAL_MODE)
+            print(f"📦 Loaded persisted index from {self.index_dir}")
+            if self.index_key != key:
+                self.reindex()
+            return
+
+        self.docsearch, self.problematic_embeddings, self.manifest = build_index(
+            self.context_dir, hashes, self.embeddings_model,
+            CHUNK_SIZE, CHUNK_OVERLAP, self.problematic_phrases, INDEX_DTYPE
+        )
+        self.retriever = HybridRetriever(self.docsearch, RETRIEVAL_MODE)
+        self.index_key = key
+        self._save_index()
 
+    def _save_index(self):
+        if save_index(self.index_dir, self.index_key, self.docsearch, self.problematic_embeddings,
+                      settings_key=self.settings_key, manifest=self.manifest):
+            print(f"💾 Saved index to {self.index_dir}")
 
-    def check_meta_commentary_similarity(self, response, threshold=0.7):
+    def reindex(self):
+        """
+        Bring the index up to date with the context directory, embedding only
+        chunks from added or modified files and deleting vectors of removed ones.
+        Changes are applied to a copy that is swapped in with one assignment,
+        so in-flight get_response calls finish on the index they started with.
+        Returns True if anything changed.
+        """
+        with self._index_lock:
+            hashes = file_hashes(self.context_dir)
+            added, modified, removed = diff_manifest(self.manifest, hashes)
+            if not (added or modified or removed):
+                return False
+
+            print(f"🔁 Re-indexing: {len(added)} added, {len(modified)} modified, {len(removed)} removed")
+            docsearch = self.docsearch.copy()
+
+            stale_ids = [
+                chunk_id
+                for rel_path in modified + removed
+                for chunk_id in self.manifest[rel_path]["chunk_ids"]
+            ]
+            if stale_ids:
+                docsearch.delete(stale_ids)
+
+            docs, ids, chunk_ids_by_file = split_files(
+                self.context_dir, added + modified, CHUNK_SIZE, CHUNK_OVERLAP
+            )
+            if docs:
+                vectors = self.embeddings_model.embed_documents([doc.page_content for doc in docs])
+                docsearch.add_embeddings(docs, ids, vectors)
+
+            manifest = {p: entry for p, entry in self.manifest.items() if p not in removed}
+            for rel_path, chunk_ids in chunk_ids_by_file.items():
+                manifest[rel_path] = {"hash": hashes[rel_path], "chunk_ids": chunk_ids}
+
+            # Hot-swap: readers pick up the new store on their next request
+            self.retriever = HybridRetriever(docsearch, RETRIEVAL_MODE)
+            self.docsearch = docsearch
+            self.manifest = manifest
+            self.index_key = compute_index_key(hashes, self.settings_key)
+            self._save_index()
+            return True
+
+    def after_fork(self):
+        """Restart thread pools and background threads after being forked into a worker process"""
+        self._executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="chatbot-cpu")
+        self.llm.after_fork()
+        self.sessions.after_fork()
+        if hasattr(self.embeddings_model, "after_fork"):
+            self.embeddings_model.after_fork()
+
+    def watch(self, interval=2.0, stop_event=None):
+        """Poll the context directory and re-index whenever a file changes"""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.wait(interval):
+            try:
+                self.reindex()
+            except Exception as e:
+                print(f"❌ Re-index failed: {e}")
+
+    @METRICS.timed("guardrail")
+    def check_meta_commentary_similarity(self, response, threshold=None):
         """
         Check if response contains meta-commentary using cosine similarity
-        Returns True if problematic content is detected
+        Returns (is_problematic, max_similarity)
         """
         try:
-            # Get embedding for the response
-            response_embedding = self.embeddings_model.embed_query(response)
-            
-            # Calculate similarity with each problematic phrase
-            similarities = []
-            for prob_embedding in self.problematic_embeddings:
-                similarity = cosine_similarity(
-                    [response_embedding], 
-                    [prob_embedding]
-                )[0][0]
-                similarities.append(similarity)
-            
-            # Check if any similarity exceeds threshold
-            max_similarity = max(similarities)
-            return max_similarity > threshold, max_similarity
+            return self.guardrail.check(response, threshold)
             
         except Exception as e:
             print(f"Error in similarity check: {e}")
             return False, 0.0
 
+    @METRICS.timed("refinement")
     def refine_response(self, original_question, problematic_response):
         """Ask the model to refine its response"""
         try:
@@ -200,60 +371,468 @@ Please provide a refined answer that:
             
         except Exception as e:
             print(f"Error in refinement: {e}")
-            return "I'm sorry, I don't have that information."
-
-    def get_response(self, user_message):
-        """Get response with conversation context"""
-        try:
-            # Add user message to history
-            self.conversation_history.append(f"User: {user_message}")
-            
-            # Keep only last 10 messages to avoid context overflow
-            if len(self.conversation_history) > 10:
-                self.conversation_history = self.conversation_history[-10:]
-            
-            # Format conversation history
-            conv_history = "\n".join(self.conversation_history[-6:])  # Last 6 messages
-            
-            # Create the prompt with context
-            context_docs = self.docsearch.as_retriever().invoke(user_message)
-            context_text = "\n\n".join([doc.page_content for doc in context_docs])
+            return FALLBACK_RESPONSE
 
-            prompt_text = self.prompt.format(
-                context=context_text,
-                question=user_message,
-                conversation_history=conv_history
+    @METRICS.timed("session_load")
+    def _start_turn(self, session_id, user_message):
+        """
+        A private copy of the session history ending with the user turn;
+        nothing is stored until _finish_turn. Returns (history, cacheable):
+        only opening questions go through the answer cache, since follow-ups
+        depend on the earlier conversation.
+        """
+        history = self.sessions.load(session_id)
+        cacheable = not history
+        history.append(f"User: {user_message}")
+        del history[:-HISTORY_LINES]
+        return history, cacheable
+
+    def _finish_turn(self, session_id, user_message, response):
+        """Record the whole turn at once, after anything that concurrently finished in this session"""
+        self.sessions.append(session_id, [f"User: {user_message}", f"Assistant: {response}"], keep=HISTORY_LINES)
+
+    def _lexical_only(self):
+        """Retrieve without a query embedding when configured to or when the CPU is saturated"""
+        if RETRIEVAL_MODE == "lexical":
+            return True
+        if LEXICAL_LOAD and hasattr(os, "getloadavg"):
+            return os.getloadavg()[0] / (os.cpu_count() or 1) > LEXICAL_LOAD
+        return False
+
+    def _embed_query(self, user_message):
+        """The query embedding, or None on the lexical-only path"""
+        if self._lexical_only():
+            METRICS.count("lexical_only")
+            return None
+        with METRICS.span("embed_query"):
+            return self.embeddings_model.embed_query(user_message)
+
+    def _lookup_cached(self, query_embedding, index_key, cacheable):
+        if not cacheable or query_embedding is None:
+            return None
+        with METRICS.span("cache_lookup"):
+            cached = self.answer_cache.lookup(query_embedding, index_key)
+        METRICS.count("cache_hits" if cached is not None else "cache_misses")
+        return cached
+
+    def _build_prompt(self, user_message, history, query_embedding):
+        """
+        Assemble the full prompt within the token budget; `history` already
+        ends with the user turn. Without a query embedding retrieval falls
+        back to BM25 only.
+        """
+        # Take one reference so a concurrent re-index can't swap it mid-request
+        retriever = self.retriever
+        with METRICS.span("retrieve"):
+            scored_chunks = retriever.search_with_scores(
+                user_message, query_embedding, k=RETRIEVAL_K, diversity=RETRIEVAL_DIVERSITY
             )
-            
-            # Get response
-            response = self.llm_wrapper(prompt_text)
 
-            # Check for meta-commentary using cosine similarity
+        with METRICS.span("prompt_build"):
+            prompt_text, stats = self.prompt_builder.build(user_message, history, scored_chunks)
+        self._record_prompt(stats)
+        return prompt_text
+
+    def _record_prompt(self, stats):
+        """Update prompt size counters and log this request's token counts"""
+        trimmed = stats["chunks_dropped"] or stats["history_dropped"]
+        with self._stats_lock:
+            totals = self.prompt_stats
+            totals["requests"] += 1
+            avg = totals["prompt_tokens_avg"]
+            totals["prompt_tokens_avg"] = (
+                stats["prompt_tokens"] if avg is None else 0.9 * avg + 0.1 * stats["prompt_tokens"]
+            )
+            totals["prompt_tokens_max"] = max(totals["prompt_tokens_max"], stats["prompt_tokens"])
+            totals["trimmed"] += bool(trimmed)
+        print(f"🧮 Prompt: {stats['prompt_tokens']} tokens (context {stats['context_tokens']} in "
+              f"{stats['chunks']} chunks, {stats['chunks_merged']} merged, {stats['chunks_dropped']} dropped; "
+              f"history {stats['history_tokens']}, {stats['history_dropped']} lines dropped)")
+
+    def _record_refinement(self, outcome, refine_seconds=None):
+        """Update refinement counters and log the refinement rate"""
+        METRICS.count(outcome)
+        # Until a remote refinement has been timed, a typical LLM call is the best estimate of one
+        llm_p50 = self.llm.latency.percentile(50, 1) if outcome == "repaired_locally" else None
+        with self._stats_lock:
+            stats = self.refinement_stats
+            stats[outcome] += 1
+            if refine_seconds is not None:
+                # Running average of what a remote refinement costs
+                avg = stats["refine_seconds_avg"]
+                stats["refine_seconds_avg"] = refine_seconds if avg is None else 0.8 * avg + 0.2 * refine_seconds
+            elif outcome == "repaired_locally":
+                estimate = stats["refine_seconds_avg"]
+                stats["seconds_saved"] += (estimate if estimate is not None else llm_p50) or 0.0
+
+            rate = stats["refined_remotely"] / stats["checked"] if stats["checked"] else 0.0
+            print(f"📊 Refinement: {stats['flagged']}/{stats['checked']} flagged, "
+                  f"{stats['repaired_locally']} repaired locally, remote rate {rate:.1%}, "
+                  f"~{stats['seconds_saved']:.1f}s saved")
+
+    def _local_refine(self, response, similarity_score=None, allow_local=True):
+        """
+        Check for meta-commentary and try to fix it without the LLM.
+        Returns the (possibly repaired) answer, or None when a remote
+        refinement is needed.
+        """
+        with self._stats_lock:
+            self.refinement_stats["checked"] += 1
+        if similarity_score is None:
             is_problematic, similarity_score = self.check_meta_commentary_similarity(response)
+            if not is_problematic:
+                return response
 
-            if is_problematic:
-                print(f"🔄 Detected meta-commentary (similarity: {similarity_score:.3f}). Refining response...")
-                response = self.refine_response(user_message, response)
-                
-                # Double-check the refined response
-                is_still_problematic, new_similarity = self.check_meta_commentary_similarity(response)
-                if is_still_problematic:
-                    print(f"⚠️ Refined response still problematic. Using fallback.")
-                    response = "I'm sorry, I don't have that information."
-            
+        METRICS.count("refinement_triggered")
+        with self._stats_lock:
+            self.refinement_stats["flagged"] += 1
+        print(f"🔄 Detected meta-commentary (similarity: {similarity_score:.3f}). Refining response...")
+
+        if allow_local:
+            try:
+                with METRICS.span("local_repair"):
+                    repaired = self.guardrail.repair(response)
+            except Exception as e:
+                print(f"Error in local repair: {e}")
+                repaired = None
+            if repaired:
+                self._record_refinement("repaired_locally")
+                return repaired
+        return None
+
+    def _check_refined(self, response, refine_seconds):
+        """Record a remote refinement and fall back if it is still problematic"""
+        self._record_refinement("refined_remotely", refine_seconds)
+        
+        # Double-check the refined response
+        is_still_problematic, new_similarity = self.check_meta_commentary_similarity(response)
+        if is_still_problematic:
+            print(f"⚠️ Refined response still problematic. Using fallback.")
+            self._record_refinement("fallback")
+            return FALLBACK_RESPONSE, False
+        return response, True
+
+    def _refine_if_needed(self, user_message, response, similarity_score=None, allow_local=True):
+        """
+        Run the meta-commentary check and fix the answer when it fires:
+        first by dropping/trimming the offending sentences locally, and only
+        if nothing useful remains by asking the LLM to rewrite it.
+        Returns (response, passed) where passed means the returned answer
+        cleared the check.
+        """
+        fixed = self._local_refine(response, similarity_score, allow_local)
+        if fixed is not None:
+            return fixed, True
+
+        refine_start = time.time()
+        response = self.refine_response(user_message, response)
+        return self._check_refined(response, time.time() - refine_start)
+
+    def _cache_answer(self, query_embedding, user_message, response, passed, index_key):
+        if passed and response and response != LLM_ERROR_RESPONSE and query_embedding is not None:
+            self.answer_cache.store(query_embedding, response, index_key, question=user_message)
+
+    def _flight_key(self, user_message, index_key):
+        return normalize_question(user_message), index_key
+
+    def _answer(self, user_message, history, query_embedding, index_key, cacheable):
+        """Retrieve, call the LLM and refine: everything a cache miss costs"""
+        prompt_text = self._build_prompt(user_message, history, query_embedding)
+        
+        # Get response
+        response = self.llm_wrapper(prompt_text)
+
+        # Check for meta-commentary using cosine similarity
+        response, passed = self._refine_if_needed(user_message, response)
+        if cacheable:
+            self._cache_answer(query_embedding, user_message, response, passed, index_key)
+        return response
+
+    @METRICS.timed("request")
+    def get_response(self, user_message, session_id=None):
+        """Get response with the conversation context of `session_id`"""
+        METRICS.count("requests")
+        try:
+            history, cacheable = self._start_turn(session_id, user_message)
+            index_key = self.index_key
+
+            # One embedding serves both the answer cache and retrieval
+            query_embedding = self._embed_query(user_message)
+            response = self._lookup_cached(query_embedding, index_key, cacheable)
+
+            if response is None:
+                answer = lambda: self._answer(user_message, history, query_embedding, index_key, cacheable)
+                if cacheable and COALESCE:
+                    try:
+                        response, _ = self.inflight.do(
+                            self._flight_key(user_message, index_key), answer, timeout=REQUEST_TIMEOUT
+                        )
+                    except SingleFlightTimeout:
+                        METRICS.count("timeouts")
+                        response = TIMEOUT_RESPONSE
+                else:
+                    response = answer()
             
-            # Add bot response to history
-            self.conversation_history.append(f"Assistant: {response}")
+            self._finish_turn(session_id, user_message, response)
             
             return response
             
         except Exception as e:
+            METRICS.count("errors")
             print(f"❌ Error in get_response: {e}")
-            return "I'm sorry, I encountered an error. Please try again."
+            return ERROR_RESPONSE
+
+    def stream_response(self, user_message, session_id=None):
+        """
+        Stream the answer as it is generated. Yields (event, text) pairs:
+          ("token", text)    a piece of the answer, in order
+          ("replace", text)  discard everything streamed so far and show text
+          ("done", text)     the final answer (as stored in history)
+        The meta-commentary check runs on each completed sentence, so a bad
+        answer is cut off as soon as it shows up instead of after the whole
+        completion has been generated.
+        """
+        METRICS.count("requests")
+        started = time.perf_counter()
+        flight = None  # (key, call) while this stream leads a coalesced call
+        try:
+            history, cacheable = self._start_turn(session_id, user_message)
+            index_key = self.index_key
+            query_embedding = self._embed_query(user_message)
+            cached = self._lookup_cached(query_embedding, index_key, cacheable)
+            if cached is None and cacheable and COALESCE:
+                # A duplicate of a question already being answered waits for that answer
+                key = self._flight_key(user_message, index_key)
+                while flight is None and cached is None:
+                    call, leader = self.inflight.begin(key)
+                    if leader:
+                        flight = (key, call)
+                        continue
+                    try:
+                        cached = self.inflight.wait(call, REQUEST_TIMEOUT)
+                    except SingleFlightAbandoned:
+                        pass  # nobody is answering any more: take over
+            if cached is not None:
+                METRICS.observe("first_token", time.perf_counter() - started)
+                yield "token", cached
+                self._finish_turn(session_id, user_message, cached)
+                yield "done", cached
+                METRICS.observe("request_stream", time.perf_counter() - started)
+                return
+
+            prompt_text = self._build_prompt(user_message, history, query_embedding)
+            METRICS.count("llm_calls")
+            llm_started = time.perf_counter()
+            stream = self.llm.chat_completion(
+                messages=[{"role": "user", "content": prompt_text}],
+                max_tokens=200,
+                temperature=0.4,
+                stream=True
+            )
+
+            buffer = ""
+            checked_upto = 0
+            problematic_score = None
+
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                if not buffer:
+                    METRICS.observe("first_token", time.perf_counter() - started)
+                buffer += token
+                yield "token", token
+
+                # Check the newest complete sentence(s) only
+                boundary = max(buffer.rfind(c) for c in ".!?\n")
+                if boundary >= checked_upto:
+                    is_problematic, score = self.check_meta_commentary_similarity(
+                        buffer[checked_upto:boundary + 1]
+                    )
+                    checked_upto = boundary + 1
+                    if is_problematic:
+                        problematic_score = score
+                        break
+
+            if problematic_score is None:
+                # Whatever trails the last sentence boundary still needs a look
+                tail = buffer[checked_upto:]
+                if tail.strip():
+                    is_problematic, score = self.check_meta_commentary_similarity(tail)
+                    if is_problematic:
+                        problematic_score = score
+
+            METRICS.observe("llm_stream", time.perf_counter() - llm_started)
+            response, passed = buffer.strip(), True
+            if problematic_score is None:
+                with self._stats_lock:
+                    self.refinement_stats["checked"] += 1
+            else:
+                if hasattr(stream, "close"):
+                    stream.close()  # stop generating tokens we won't use
+                # The answer was cut off mid-way, so a local repair would be truncated
+                response, passed = self._refine_if_needed(
+                    user_message, buffer, problematic_score, allow_local=False
+                )
+                yield "replace", response
+            if cacheable:
+                self._cache_answer(query_embedding, user_message, response, passed, index_key)
+            if flight:
+                self.inflight.finish(*flight, result=response)
+
+        except Exception as e:
+            if flight:
+                self.inflight.finish(*flight, error=e)
+            from chatbot.llm_client import LLMUnavailable
+
+            if isinstance(e, SingleFlightTimeout):
+                METRICS.count("timeouts")
+                response = TIMEOUT_RESPONSE
+            elif isinstance(e, LLMUnavailable):
+                METRICS.count("llm_errors")
+                print(f"⚡ AI API unavailable: {e}")
+                response = LLM_ERROR_RESPONSE
+            else:
+                METRICS.count("errors")
+                print(f"❌ Error in stream_response: {e}")
+                response = ERROR_RESPONSE
+            yield "replace", response
+
+        finally:
+            # The client went away mid-stream: don't leave duplicates waiting
+            if flight and not flight[1].done.is_set():
+                self.inflight.finish(*flight, error=SingleFlightAbandoned("stream closed before the answer finished"))
+
+        self._finish_turn(session_id, user_message, response)
+        yield "done", response
+        METRICS.observe("request_stream", time.perf_counter() - started)
+
+    async def _allm(self, prompt_text):
+        """Async counterpart of llm_wrapper"""
+        METRICS.count("llm_calls")
+        try:
+            with METRICS.span("llm"):
+                response = await self.llm.achat_completion(
+                    messages=[{"role": "user", "content": prompt_text}],
+                    max_tokens=200,
+                    temperature=0.4
+                )
+            return response.choices[0].message["content"]
+        except Exception as e:
+            METRICS.count("llm_errors")
+            print(f"❌ AI API Error: {e}")
+            return LLM_ERROR_RESPONSE
+
+    async def _run_cpu(self, func, *args):
+        """Run blocking embedding/vector search work in the bounded CPU pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _arefine_if_needed(self, user_message, response):
+        fixed = await self._run_cpu(self._local_refine, response)
+        if fixed is not None:
+            return fixed, True
+
+        refine_start = time.time()
+        with METRICS.span("refinement"):
+            refined = await self._allm(self.refinement_prompt.format(
+                question=user_message,
+                previous_response=response
+            ))
+        return await self._run_cpu(self._check_refined, refined, time.time() - refine_start)
+
+    async def _aanswer(self, user_message, history, query_embedding, index_key, cacheable):
+        prompt_text = await self._run_cpu(self._build_prompt, user_message, history, query_embedding)
+        response = await self._allm(prompt_text)
+        response, passed = await self._arefine_if_needed(user_message, response)
+        if cacheable:
+            self._cache_answer(query_embedding, user_message, response, passed, index_key)
+        return response
+
+    async def _aget_response(self, user_message, session_id):
+        history, cacheable = await self._run_cpu(self._start_turn, session_id, user_message)
+        index_key = self.index_key
+
+        query_embedding = await self._run_cpu(self._embed_query, user_message)
+        response = self._lookup_cached(query_embedding, index_key, cacheable)
+
+        if response is None:
+            answer = lambda: self._aanswer(user_message, history, query_embedding, index_key, cacheable)
+            if cacheable and COALESCE:
+                # The deadline is enforced by aget_response; the shared call outlives it
+                response, _ = await self.inflight.ado(self._flight_key(user_message, index_key), answer)
+            else:
+                response = await answer()
+
+        await self._run_cpu(self._finish_turn, session_id, user_message, response)
+        return response
+
+    async def aget_response(self, user_message, session_id=None, timeout=REQUEST_TIMEOUT):
+        """
+        Async get_response: the LLM calls don't hold a thread, CPU-bound work
+        runs in a bounded pool, and the whole request must finish within
+        `timeout` seconds.
+        """
+        METRICS.count("requests")
+        try:
+            with METRICS.span("request"):
+                return await asyncio.wait_for(self._aget_response(user_message, session_id), timeout)
+        except asyncio.TimeoutError:
+            METRICS.count("timeouts")
+            print(f"⏱️ get_response exceeded its {timeout:.1f}s deadline")
+            return TIMEOUT_RESPONSE
+        except Exception as e:
+            METRICS.count("errors")
+            print(f"❌ Error in aget_response: {e}")
+            return ERROR_RESPONSE
+
+
+class LexicalResponder:
+    """
+    Stand-in used while the Chatbot is still loading its embedding model.
+    It needs only the persisted chunk table (no embeddings) and an LLM
+    client, so it is ready in milliseconds: BM25 picks the context, there
+    is no session history or answer cache, and since the embedding
+    guardrail isn't available an answer containing any guardrail trigger
+    word is replaced by FALLBACK_RESPONSE.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        from chatbot.llm_client import ResilientLLM
+        from chatbot.vector_store import CompactVectorStore
+
+        self.retriever = HybridRetriever(CompactVectorStore.load_local(index_dir), mode="lexical")
+        self.triggers = [t.lower() for t in load_guardrail_config()["triggers"]]
+        # Must be quick: use the tokenizer only if it is already cached
+        self.prompt_builder = PromptBuilder(PROMPT_TEMPLATE, load_token_counter(local_only=True))
+        self.llm = ResilientLLM.from_env()
+
+    def get_response(self, user_message):
+        scored_chunks = self.retriever.search_with_scores(user_message, k=RETRIEVAL_K, diversity=RETRIEVAL_DIVERSITY)
+        prompt_text, _ = self.prompt_builder.build(user_message, [f"User: {user_message}"], scored_chunks)
+        try:
+            response = self.llm.chat_completion(
+                messages=[{"role": "user", "content": prompt_text}],
+                max_tokens=200,
+                temperature=0.4
+            )
+            answer = response.choices[0].message["content"].strip()
+        except Exception as e:
+            print(f"❌ AI API Error (lexical): {e}")
+            return LLM_ERROR_RESPONSE
+
+        if any(trigger in answer.lower() for trigger in self.triggers):
+            return FALLBACK_RESPONSE
+        return answer
 
 
 if __name__ == "__main__":
     bot = Chatbot()
+    if "--watch" in sys.argv:
+        print(f"👀 Watching {bot.context_dir} for changes...")
+        threading.Thread(target=bot.watch, daemon=True).start()
     while True:
         user_input = input("Ask me anything: ")
         if user_input.lower() in ["exit", "quit", "bye"]:
@@ -0,0 +1,120 @@
+"""
+Micro-batching scheduler for query embeddings.
+
+Every request embeds its question (and the guardrail may embed the answer),
+one tiny forward pass at a time. Under concurrent load it is much cheaper to
+run those as one batch. BatchingEmbeddings wraps an embeddings model: a
+background worker takes the first queued embed_query call, waits up to
+`max_wait_ms` for more to arrive (or until `max_batch_size` is reached),
+and runs them all through a single embed_documents call.
+
+Callers just block on their own result, so it is a drop-in replacement for
+the wrapped model and safe to use from any number of threads.
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+
+EMBED_MAX_BATCH = int(os.getenv("CHATBOT_EMBED_MAX_BATCH", 32))
+EMBED_MAX_WAIT_MS = float(os.getenv("CHATBOT_EMBED_MAX_WAIT_MS", 5))
+
+
+class _Request:
+    __slots__ = ("text", "enqueued", "done", "result", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEmbeddings:
+    def __init__(self, base, max_batch_size=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.base = base
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=1024)  # seconds, most recent requests
+        self._start_worker()
+
+    def _start_worker(self):
+        self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    def after_fork(self):
+        """In a forked child the worker thread is gone: start a new one with a fresh queue"""
+        self._queue = queue.Queue()
+        self._start_worker()
+
+    def __getattr__(self, name):
+        # Anything we don't override (model_name, client, ...) comes from the wrapped model
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def embed_documents(self, texts):
+        # Already a batch; no point queueing it
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        request = _Request(text)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        """Block for one request, then gather more until the batch is full or max_wait passes"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = self.base.embed_documents([r.text for r in batch])
+                for request, vector in zip(batch, vectors):
+                    request.result = vector
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._queue_waits.extend(started - r.enqueued for r in batch)
+            for request in batch:
+                request.done.set()
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._queue_waits)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+        batches = sum(batch_sizes.values())
+        queries = sum(size * n for size, n in batch_sizes.items())
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3) if waits else 0.0
+
+        return {
+            "batches": batches,
+            "queries": queries,
+            "avg_batch_size": round(queries / batches, 2) if batches else 0.0,
+            "batch_sizes": batch_sizes,
+            "queue_wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+        }
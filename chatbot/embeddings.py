@@ -0,0 +1,217 @@
+"""
+Embedding backends.
+
+Everything that embeds text (index build, queries, guardrail, answer
+cache) goes through one of these, selected by CHATBOT_EMBEDDING_BACKEND:
+
+    sentence-transformers   the reference model via sentence_transformers (torch)
+    onnx                    int8-quantized ONNX export run with onnxruntime +
+                            tokenizers, loaded from CHATBOT_ONNX_MODEL_DIR; no torch
+    hashing                 deterministic feature hashing, no model at all (tests,
+                            benchmarks, offline development)
+
+Each backend exposes `name` (folded into the index key, so switching
+backends rebuilds the index), `embed_documents` and `embed_query`.
+
+Check a backend against the reference before switching production to it:
+
+    python -m chatbot.embeddings parity --backend onnx
+    python -m chatbot.embeddings quantize path/to/onnx-model-dir
+"""
+import argparse
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+EMBEDDING_BACKEND = os.getenv("CHATBOT_EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_MODEL = "sentence-transformers/multi-qa-distilbert-cos-v1"
+ONNX_MODEL_DIR = os.getenv("CHATBOT_ONNX_MODEL_DIR", "chatbot/models/multi-qa-distilbert-cos-v1-onnx")
+HASHING_DIM = int(os.getenv("CHATBOT_HASHING_DIM", 384))
+
+
+class EmbeddingBackend:
+    name = "base"
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The reference model, exactly as HuggingFaceEmbeddings used to run it"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.name = f"sentence-transformers:{model_name}"
+        self.model = SentenceTransformer(
+            model_name,
+            device="cpu",
+            token=os.getenv("HUGGINGFACEHUB_API_TOKEN")
+        )
+
+    def embed_documents(self, texts):
+        texts = [t.replace("\n", " ") for t in texts]
+        return self.model.encode(texts, show_progress_bar=False).tolist()
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    Quantized ONNX export of the same model. The directory needs
+    model.onnx (or model_quantized.onnx) and tokenizer.json, e.g.
+
+        optimum-cli export onnx --model sentence-transformers/multi-qa-distilbert-cos-v1 DIR
+        python -m chatbot.embeddings quantize DIR
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, max_length=512):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / "model_quantized.onnx"
+        if not model_path.exists():
+            model_path = model_dir / "model.onnx"
+
+        self.name = f"onnx:{model_dir.name}:{model_path.name}"
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("CHATBOT_ONNX_THREADS", 1))
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch([t.replace("\n", " ") for t in texts])
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize (what the model's own pipeline does)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Deterministic signed feature hashing of word unigrams and bigrams.
+    No model, no downloads: similar wording gives similar vectors, which is
+    enough for tests and benchmarks but not for real semantic search.
+    """
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def _embed(self, text):
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts):
+        return [self._embed(t).tolist() for t in texts]
+
+
+BACKENDS = {
+    "sentence-transformers": SentenceTransformerBackend,
+    "onnx": OnnxBackend,
+    "hashing": HashingBackend,
+}
+
+
+def create_embeddings(backend=None):
+    """Instantiate the configured backend"""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend]()
+
+
+def _top_k(doc_matrix, query_matrix, k):
+    doc_matrix = doc_matrix / np.linalg.norm(doc_matrix, axis=1, keepdims=True)
+    query_matrix = query_matrix / np.linalg.norm(query_matrix, axis=1, keepdims=True)
+    return np.argsort(-(query_matrix @ doc_matrix.T), axis=1)[:, :k]
+
+
+def parity(candidate, reference, texts, queries, k=4):
+    """recall@k of the candidate's neighbours against the reference's, averaged over queries"""
+    results = []
+    for backend in (reference, candidate):
+        docs = np.asarray(backend.embed_documents(texts), dtype=np.float32)
+        qs = np.asarray(backend.embed_documents(queries), dtype=np.float32)
+        results.append(_top_k(docs, qs, k))
+    reference_top, candidate_top = results
+    recalls = [len(set(r) & set(c)) / len(r) for r, c in zip(reference_top, candidate_top)]
+    return float(np.mean(recalls))
+
+
+def _quantize(model_dir):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = Path(model_dir)
+    quantize_dynamic(
+        str(model_dir / "model.onnx"),
+        str(model_dir / "model_quantized.onnx"),
+        weight_type=QuantType.QInt8
+    )
+    print(f"✅ Wrote {model_dir / 'model_quantized.onnx'}")
+
+
+def main():
+    from chatbot.chat import CHUNK_OVERLAP, CHUNK_SIZE, CONTEXT_DIR, RETRIEVAL_K
+    from chatbot.build_index import SAMPLE_QUERIES
+    from chatbot.index_store import file_hashes, split_files
+
+    parser = argparse.ArgumentParser(description="Embedding backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("parity", help="recall@k of a backend against the reference backend")
+    check.add_argument("--backend", default=EMBEDDING_BACKEND, choices=sorted(BACKENDS))
+    check.add_argument("--reference", default="sentence-transformers", choices=sorted(BACKENDS))
+    check.add_argument("-k", type=int, default=RETRIEVAL_K)
+    check.add_argument("--context-dir", default=CONTEXT_DIR)
+    quantize = sub.add_parser("quantize", help="int8-quantize DIR/model.onnx")
+    quantize.add_argument("model_dir")
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        _quantize(args.model_dir)
+        return
+
+    docs, _, _ = split_files(args.context_dir, sorted(file_hashes(args.context_dir)), CHUNK_SIZE, CHUNK_OVERLAP)
+    texts = [doc.page_content for doc in docs]
+    queries = SAMPLE_QUERIES + texts
+    reference, candidate = create_embeddings(args.reference), create_embeddings(args.backend)
+    recall = parity(candidate, reference, texts, queries, args.k)
+    print(f"🔎 {candidate.name} vs {reference.name}: recall@{args.k} = {recall:.1%} over {len(queries)} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Offline retrieval quality vs. cost evaluation.
+
+Asks every question in a gold set (chatbot/bench/gold.json: the question
+and the context files that answer it) against indexes built over
+chatbot/context with each combination of chunk size and overlap, at each
+k, retrieval mode and MMR diversity:
+
+    python -m chatbot.eval_retrieval
+    python -m chatbot.eval_retrieval --chunk-sizes 256,512 --overlaps 0,30 -k 3,4 \\
+        --modes hybrid --diversity 0,0.3 --output eval.json
+
+For each configuration it reports:
+
+    recall@k     share of a question's expected files among the top-k chunks' files
+    MRR          1 / rank of the first chunk from an expected file (0 if none)
+    build ms     split + embed + index, once per chunk size/overlap
+    p50/p95 ms   query latency: the query embedding plus retrieval
+    tokens       context tokens the top-k chunks add to the prompt (after
+                 merging neighbours, before the prompt budget)
+
+and recommends the cheapest configuration (fewest context tokens, then
+fastest) within --tolerance of the best recall and, among those, of the
+best MRR. Its
+settings map onto CHATBOT_CHUNK_SIZE, CHATBOT_CHUNK_OVERLAP,
+CHATBOT_RETRIEVAL_K, CHATBOT_RETRIEVAL_MODE and CHATBOT_RETRIEVAL_DIVERSITY.
+
+The embedding backend is CHATBOT_EMBEDDING_BACKEND (--fake-embeddings for
+the hashing backend, which makes dense numbers meaningless but needs no
+model); prompt tokens are estimated unless --tokenizer is given.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from chatbot.benchmark import summarize
+
+GOLD_FILE = ROOT / "chatbot" / "bench" / "gold.json"
+CONTEXT_DIR = ROOT / "chatbot" / "context"
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _floats(value):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def _source(chunk):
+    """The context file a chunk came from (chunk IDs are 'file#index')"""
+    return chunk.id.split("+", 1)[0].rpartition("#")[0]
+
+
+def score_ranking(sources, expected):
+    """(recall, reciprocal rank) of one ranked list of source files"""
+    expected = set(expected)
+    recall = len(expected & set(sources)) / len(expected)
+    rank = next((i for i, source in enumerate(sources, start=1) if source in expected), None)
+    return recall, (1.0 / rank if rank else 0.0)
+
+
+def build(context_dir, embeddings, chunk_size, chunk_overlap, dtype):
+    """(retriever, chunks, build seconds) for one chunking configuration"""
+    from chatbot.index_store import file_hashes, split_files
+    from chatbot.retrieval import HybridRetriever
+    from chatbot.vector_store import CompactVectorStore
+
+    start = time.perf_counter()
+    docs, ids, _ = split_files(context_dir, sorted(file_hashes(context_dir)), chunk_size, chunk_overlap)
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    retriever = HybridRetriever(CompactVectorStore.from_embeddings(docs, ids, vectors, dtype))
+    return retriever, len(docs), time.perf_counter() - start
+
+
+def evaluate(retriever, gold, query_embeddings, embed_seconds, counter, k, mode, diversity):
+    """Quality and cost of one retriever setting over the gold set"""
+    from chatbot.prompt_builder import merge_adjacent
+
+    recalls, reciprocal_ranks, latencies, tokens = [], [], [], []
+    for item, query_embedding, embed_time in zip(gold, query_embeddings, embed_seconds):
+        start = time.perf_counter()
+        scored = retriever.search_with_scores(item["question"], query_embedding, k=k, mode=mode, diversity=diversity)
+        # Lexical retrieval doesn't need the query embedding
+        latencies.append((0.0 if mode == "lexical" else embed_time) + time.perf_counter() - start)
+
+        recall, reciprocal_rank = score_ranking([_source(chunk) for chunk, _ in scored], item["sources"])
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        tokens.append(sum(counter.count(chunk.page_content) for chunk, _ in merge_adjacent(scored)))
+
+    latency = summarize(latencies)
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "p50_ms": latency["p50"],
+        "p95_ms": latency["p95"],
+        "tokens": round(float(np.mean(tokens)), 1),
+    }
+
+
+def recommend(rows, tolerance):
+    """Cheapest row within `tolerance` of the best recall and, among those, of the best MRR"""
+    best_recall = max(row["recall"] for row in rows)
+    good = [row for row in rows if row["recall"] >= best_recall - tolerance]
+    best_mrr = max(row["mrr"] for row in good)
+    good = [row for row in good if row["mrr"] >= best_mrr - tolerance]
+    return min(good, key=lambda row: (row["tokens"], row["p95_ms"], -row["recall"]))
+
+
+def _env(row):
+    return (f"CHATBOT_CHUNK_SIZE={row['chunk_size']} CHATBOT_CHUNK_OVERLAP={row['chunk_overlap']} "
+            f"CHATBOT_RETRIEVAL_K={row['k']} CHATBOT_RETRIEVAL_MODE={row['mode']} "
+            f"CHATBOT_RETRIEVAL_DIVERSITY={row['diversity']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs. latency over a gold set")
+    parser.add_argument("--gold", default=str(GOLD_FILE))
+    parser.add_argument("--context-dir", default=str(CONTEXT_DIR))
+    parser.add_argument("--chunk-sizes", type=_ints, default=[256, 384, 512, 768])
+    parser.add_argument("--overlaps", type=_ints, default=[0, 30, 64])
+    parser.add_argument("-k", type=_ints, default=[2, 3, 4, 6])
+    parser.add_argument("--modes", type=lambda v: v.split(","), default=["hybrid", "dense", "lexical"])
+    parser.add_argument("--diversity", type=_floats, default=[0.0, 0.3], help="MMR diversity values (0 = plain)")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use the hashing embedding backend")
+    parser.add_argument("--tokenizer", default="estimate", help="tokenizer.json for counting context tokens")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="recall/MRR slack for the recommendation")
+    parser.add_argument("--top", type=int, default=20, help="rows to print (all are written to --output)")
+    parser.add_argument("--output", help="write every row as JSON")
+    args = parser.parse_args()
+
+    from chatbot.chat import (
+        CHUNK_OVERLAP, CHUNK_SIZE, INDEX_DTYPE, RETRIEVAL_DIVERSITY, RETRIEVAL_K, RETRIEVAL_MODE, load_embeddings
+    )
+    from chatbot.embeddings import create_embeddings
+    from chatbot.prompt_builder import load_token_counter
+
+    gold = json.loads(Path(args.gold).read_text(encoding="utf-8"))
+    embeddings = create_embeddings("hashing") if args.fake_embeddings else load_embeddings()
+    counter = load_token_counter(args.tokenizer)
+
+    # Query embeddings don't depend on the index, so each question is embedded once
+    query_embeddings, embed_seconds = [], []
+    for item in gold:
+        start = time.perf_counter()
+        query_embeddings.append(embeddings.embed_query(item["question"]))
+        embed_seconds.append(time.perf_counter() - start)
+    print(f"📝 {len(gold)} questions, embedded with {embeddings.name} "
+          f"(mean {np.mean(embed_seconds) * 1000:.1f} ms per query)")
+
+    # Warm-up, so the first configuration's build time doesn't include imports
+    build(args.context_dir, embeddings, args.chunk_sizes[0], 0, INDEX_DTYPE)
+
+    production = (CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_K, RETRIEVAL_MODE, RETRIEVAL_DIVERSITY)
+    rows = []
+    for chunk_size in args.chunk_sizes:
+        for chunk_overlap in args.overlaps:
+            if chunk_overlap >= chunk_size:
+                continue
+            retriever, chunks, build_seconds = build(
+                args.context_dir, embeddings, chunk_size, chunk_overlap, INDEX_DTYPE
+            )
+            print(f"🔨 chunk_size={chunk_size} overlap={chunk_overlap}: {chunks} chunks in {build_seconds * 1000:.0f} ms")
+            for k in args.k:
+                for mode in args.modes:
+                    for diversity in args.diversity:
+                        row = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "k": k, "mode": mode,
+                               "diversity": diversity, "chunks": chunks, "build_ms": round(build_seconds * 1000, 1)}
+                        row.update(evaluate(retriever, gold, query_embeddings, embed_seconds, counter,
+                                            k, mode, diversity))
+                        row["production"] = (chunk_size, chunk_overlap, k, mode, diversity) == production
+                        rows.append(row)
+
+    rows.sort(key=lambda row: (-row["recall"], -row["mrr"], row["tokens"], row["p95_ms"]))
+    print(f"\n  {'size':>5}{'ovl':>5}{'k':>3} {'mode':<8}{'mmr':>5}{'chunks':>7}{'build ms':>10}"
+          f"{'recall':>8}{'MRR':>7}{'p50 ms':>8}{'p95 ms':>8}{'tokens':>8}")
+    shown = rows[:args.top] + [row for row in rows[args.top:] if row["production"]]
+    for row in shown:
+        print(f"{'*' if row['production'] else ' '} {row['chunk_size']:>5}{row['chunk_overlap']:>5}{row['k']:>3} "
+              f"{row['mode']:<8}{row['diversity']:>5.2f}{row['chunks']:>7}{row['build_ms']:>10.0f}"
+              f"{row['recall']:>8.3f}{row['mrr']:>7.3f}{row['p50_ms']:>8.2f}{row['p95_ms']:>8.2f}{row['tokens']:>8.0f}")
+    print("  (* = current production settings)")
+
+    best = recommend(rows, args.tolerance)
+    current = next((row for row in rows if row["production"]), None)
+    print(f"\n🏆 Recommended: {_env(best)}")
+    print(f"   recall@{best['k']} {best['recall']:.3f}, MRR {best['mrr']:.3f}, "
+          f"{best['tokens']:.0f} context tokens, p95 {best['p95_ms']:.2f} ms")
+    if current:
+        print(f"   production now: recall@{current['k']} {current['recall']:.3f}, MRR {current['mrr']:.3f}, "
+              f"{current['tokens']:.0f} context tokens, p95 {current['p95_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"embedding_backend": embeddings.name, "questions": len(gold), "rows": rows,
+                       "recommended": best}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
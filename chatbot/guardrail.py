@@ -0,0 +1,141 @@
+"""
+Meta-commentary guardrail.
+
+Answers like "Based on the documents I have, ..." leak how the bot works.
+The guard scores a response against a list of known-bad phrases:
+
+  1. A lexical prefilter looks for trigger words ("document", "context",
+     "based on", ...). Clean answers never reach the embedding model.
+  2. Otherwise the whole response and each of its sentences are embedded
+     in one batch and scored against every phrase with a single matmul
+     over a pre-normalized phrase matrix.
+
+Phrases, triggers and threshold come from chatbot/guardrail.json; a file
+named by CHATBOT_GUARDRAIL_CONFIG overrides the keys it sets, and
+CHATBOT_GUARDRAIL_THRESHOLD overrides the threshold.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+
+# Shipped with the package: the phrases, triggers and threshold in use
+DEFAULT_GUARDRAIL_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guardrail.json")
+GUARDRAIL_CONFIG = os.getenv("CHATBOT_GUARDRAIL_CONFIG", DEFAULT_GUARDRAIL_CONFIG)
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def load_guardrail_config(path=GUARDRAIL_CONFIG):
+    """Read chatbot/guardrail.json, with the keys of a custom config file (if any) on top"""
+    with open(DEFAULT_GUARDRAIL_CONFIG, encoding="utf-8") as f:
+        config = json.load(f)
+    if os.path.abspath(path) != DEFAULT_GUARDRAIL_CONFIG:
+        try:
+            with open(path, encoding="utf-8") as f:
+                config.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read guardrail config {path}: {e}")
+
+    if os.getenv("CHATBOT_GUARDRAIL_THRESHOLD"):
+        config["threshold"] = float(os.getenv("CHATBOT_GUARDRAIL_THRESHOLD"))
+    return config
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class MetaCommentaryGuard:
+    def __init__(self, embeddings, phrases, phrase_embeddings=None, threshold=0.7, triggers=()):
+        self.embeddings = embeddings
+        self.phrases = list(phrases)
+        self.threshold = threshold
+        self.triggers = [t.lower() for t in triggers]
+        self._trigger_re = (
+            re.compile("|".join(re.escape(t) for t in self.triggers)) if self.triggers else None
+        )
+
+        if phrase_embeddings is None:
+            phrase_embeddings = embeddings.embed_documents(self.phrases)
+        # (P, D), unit rows: a dot product is the cosine similarity
+        self.phrase_matrix = normalize_rows(phrase_embeddings)
+
+        for phrase in self.phrases:
+            if not self.might_be_problematic(phrase):
+                print(f"⚠️ Guardrail phrase bypasses the lexical prefilter: {phrase!r}")
+
+    def might_be_problematic(self, text):
+        """Cheap lexical prefilter; False means the text can't match"""
+        if self._trigger_re is None:
+            return True
+        return self._trigger_re.search(text.lower()) is not None
+
+    def score(self, texts):
+        """Max phrase similarity for each text, from one batched embed"""
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        vectors = normalize_rows(self.embeddings.embed_documents(list(texts)))
+        return (vectors @ self.phrase_matrix.T).max(axis=1)
+
+    def check(self, response, threshold=None):
+        """
+        Returns (is_problematic, max_similarity) over the whole response
+        and each of its sentences.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if not response or not response.strip() or not self.might_be_problematic(response):
+            return False, 0.0
+
+        sentences = split_sentences(response)
+        texts = [response] + sentences if len(sentences) > 1 else [response]
+        max_similarity = float(self.score(texts).max())
+        return max_similarity > threshold, max_similarity
+
+    def repair(self, response, threshold=None, min_words=3):
+        """
+        Remove meta-commentary locally instead of asking the LLM again.
+        Offending sentences are trimmed to what follows their lead-in clause
+        ("Based on the documents I have, he ..." -> "He ...") or dropped.
+        Returns the repaired text, or None when nothing useful remains.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        sentences = split_sentences(response)
+        suspects = [i for i, s in enumerate(sentences) if self.might_be_problematic(s)]
+        if not suspects:
+            return response
+
+        scores = self.score([sentences[i] for i in suspects])
+        offending = [i for i, score in zip(suspects, scores) if score > threshold]
+
+        # Try to salvage the part after the lead-in clause, scored in one batch
+        trimmed = {}
+        for i in offending:
+            head, sep, tail = sentences[i].partition(",")
+            if sep and len(tail.split()) >= min_words:
+                tail = tail.strip()
+                trimmed[i] = tail[0].upper() + tail[1:]
+        keys = [i for i in trimmed if self.might_be_problematic(trimmed[i])]
+        if keys:
+            for i, score in zip(keys, self.score([trimmed[i] for i in keys])):
+                if score > threshold:
+                    del trimmed[i]
+
+        kept = [trimmed.get(i) if i in offending else s for i, s in enumerate(sentences)]
+        repaired = " ".join(s for s in kept if s)
+        if len(repaired.split()) < min_words:
+            return None
+
+        is_problematic, _ = self.check(repaired, threshold)
+        return None if is_problematic else repaired
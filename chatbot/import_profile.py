@@ -0,0 +1,93 @@
+"""
+Import-time report and budget check for the serverless entry points.
+
+Runs a cold `python -X importtime -c "import <module>"` in a fresh
+interpreter, then summarizes the raw trace: the slowest modules by
+cumulative time and the self time grouped by top-level package. With
+--budget it exits non-zero when the cold import is over budget, so CI
+can catch a heavy import creeping back onto the handler's import path:
+
+    python -m chatbot.import_profile api.chat --budget 0.25
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", 0.25))
+
+
+def measure(module):
+    """
+    Cold-import `module` in a fresh interpreter.
+    Returns a list of (name, depth, self_us, cumulative_us) in trace order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT),
+        env={**os.environ, "CHATBOT_PREWARM": "0"},  # measure the import, not the background build
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def summarize(rows, module, top=15):
+    total_us = next((cum for name, _, _, cum in reversed(rows) if name == module), None)
+    if total_us is None:
+        total_us = sum(self_us for _, _, self_us, _ in rows)
+
+    by_package = defaultdict(int)
+    for name, _, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    slowest = sorted(rows, key=lambda row: row[3], reverse=True)[:top]
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return total_us / 1e6, slowest, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize cold import time of a module")
+    parser.add_argument("module", nargs="?", default="api.chat")
+    parser.add_argument("--budget", type=float, default=None,
+                        help=f"fail if the import takes longer (seconds, e.g. {IMPORT_BUDGET_SECONDS})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs to take the fastest of")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # The fastest run is the least disturbed by the rest of the machine
+    runs = [summarize(measure(args.module), args.module, args.top) for _ in range(args.repeat)]
+    total, slowest, packages = min(runs, key=lambda run: run[0])
+
+    print(f"⏱️ import {args.module}: {total * 1000:.1f} ms (best of {args.repeat})\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, depth, self_us, cumulative_us in slowest:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{name}")
+
+    print(f"\n{'self ms':>14}  top-level package")
+    for package, self_us in packages:
+        print(f"{self_us / 1000:>14.1f}  {package}")
+
+    if args.budget is not None:
+        if total > args.budget:
+            print(f"\n❌ Over budget: {total * 1000:.1f} ms > {args.budget * 1000:.1f} ms")
+            sys.exit(1)
+        print(f"\n✅ Within budget ({args.budget * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
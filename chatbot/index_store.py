@@ -0,0 +1,176 @@
+"""
+On-disk artifact for the chatbot's embedding index.
+
+A cold instance used to re-load, re-split and re-embed every file in
+chatbot/context. Instead we persist everything that is derived from the
+context files into one directory:
+
+    vectors.npy / chunks.json  compact vector store (see vector_store.py)
+    problematic.npy            embeddings of the meta-commentary phrases
+    meta.json                  index key, settings key and per-file manifest
+
+The index key hashes the context file contents together with the splitter
+settings and embedding backend name, so any change to those is detected. The
+manifest maps every context file to its content hash and the chunk IDs it
+produced, which lets an edit to one file re-embed only that file's chunks.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from chatbot.vector_store import CompactVectorStore
+
+
+META_FILE = "meta.json"
+PROBLEMATIC_FILE = "problematic.npy"
+
+
+def context_files(context_dir, glob="**/*.txt"):
+    """All context files in a stable order"""
+    return sorted(p for p in Path(context_dir).glob(glob) if p.is_file())
+
+
+def file_hashes(context_dir):
+    """Map of relative path -> sha256 of the file contents"""
+    context_dir = Path(context_dir)
+    return {
+        path.relative_to(context_dir).as_posix(): hashlib.sha256(path.read_bytes()).hexdigest()
+        for path in context_files(context_dir)
+    }
+
+
+def compute_settings_key(chunk_size, chunk_overlap, model_name, phrases=(), dtype="float16"):
+    """Hash of everything except file contents that shapes the index"""
+    settings = {
+        "store": "compact-v1",
+        "dtype": dtype,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "model_name": model_name,
+        "phrases": list(phrases),
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def compute_index_key(hashes, settings_key):
+    """Content hash of the context files (from file_hashes) plus the settings key"""
+    digest = hashlib.sha256()
+    for rel_path, file_hash in sorted(hashes.items()):
+        digest.update(f"{rel_path}\0{file_hash}\0".encode("utf-8"))
+    digest.update(settings_key.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def diff_manifest(manifest, hashes):
+    """
+    Compare a stored manifest against current file hashes.
+    Returns (added, modified, removed) lists of relative paths.
+    """
+    added = [p for p in hashes if p not in manifest]
+    modified = [p for p in hashes if p in manifest and manifest[p]["hash"] != hashes[p]]
+    removed = [p for p in manifest if p not in hashes]
+    return sorted(added), sorted(modified), sorted(removed)
+
+
+def split_files(context_dir, rel_paths, chunk_size, chunk_overlap):
+    """
+    Load and split the given context files.
+    Returns (docs, ids, chunk_ids_by_file) with deterministic chunk IDs.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import TextLoader
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    docs, ids, chunk_ids_by_file = [], [], {}
+
+    for rel_path in rel_paths:
+        source = os.path.join(str(context_dir), rel_path)
+        chunks = text_splitter.split_documents(TextLoader(source).load())
+        chunk_ids = [f"{rel_path}#{i}" for i in range(len(chunks))]
+        docs.extend(chunks)
+        ids.extend(chunk_ids)
+        chunk_ids_by_file[rel_path] = chunk_ids
+
+    return docs, ids, chunk_ids_by_file
+
+
+def build_index(context_dir, hashes, embeddings, chunk_size, chunk_overlap, phrases, dtype="float16"):
+    """
+    Load, split and embed every context file from scratch.
+    Returns (store, problematic_embeddings, manifest).
+    """
+    docs, ids, chunk_ids_by_file = split_files(context_dir, sorted(hashes), chunk_size, chunk_overlap)
+    print(f"📚 Loaded {len(hashes)} documents")
+
+    print("🔍 Creating embeddings...")
+    store = CompactVectorStore.from_embeddings(
+        docs, ids, embeddings.embed_documents([doc.page_content for doc in docs]), dtype
+    )
+
+    # Create embeddings for problematic meta-commentary phrases
+    problematic_embeddings = embeddings.embed_documents(list(phrases))
+
+    manifest = {
+        rel_path: {"hash": hashes[rel_path], "chunk_ids": chunk_ids}
+        for rel_path, chunk_ids in chunk_ids_by_file.items()
+    }
+    return store, problematic_embeddings, manifest
+
+
+def read_meta(index_dir):
+    try:
+        with open(Path(index_dir) / META_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_artifact(index_dir):
+    """
+    Load whatever artifact is on disk, regardless of its key.
+    The vectors are memory-mapped rather than read into memory.
+    Returns (meta, docsearch, problematic_embeddings) or None.
+    """
+    meta = read_meta(index_dir)
+    if not meta:
+        return None
+
+    try:
+        docsearch = CompactVectorStore.load_local(index_dir)
+        problematic_embeddings = np.load(Path(index_dir) / PROBLEMATIC_FILE).tolist()
+    except Exception as e:
+        print(f"⚠️ Could not load index from {index_dir}: {e}")
+        return None
+
+    return meta, docsearch, problematic_embeddings
+
+
+def save_index(index_dir, key, docsearch, problematic_embeddings, settings_key=None, manifest=None):
+    """
+    Persist the index. meta.json is removed first and written last, so a
+    crash half-way leaves an artifact that simply fails the key check.
+    Returns False when the directory isn't writable (e.g. read-only deploys).
+    """
+    index_dir = Path(index_dir)
+    meta_path = index_dir / META_FILE
+
+    try:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        if meta_path.exists():
+            meta_path.unlink()
+
+        docsearch.save_local(str(index_dir))
+        np.save(index_dir / PROBLEMATIC_FILE, np.asarray(problematic_embeddings, dtype=np.float32))
+
+        meta = {"key": key, "settings": settings_key, "files": manifest or {}}
+        tmp_path = index_dir / (META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, meta_path)
+        return True
+    except OSError as e:
+        print(f"⚠️ Could not save index to {index_dir}: {e}")
+        return False
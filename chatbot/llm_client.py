@@ -0,0 +1,431 @@
+"""
+Resilient wrapper around InferenceClient.
+
+The hosted endpoint has a long latency tail and occasional outages, and
+a bare chat_completion passes both straight on to visitors. ResilientLLM
+is a drop-in for the client (same chat_completion call and response) that
+adds:
+
+  - a per-attempt deadline (CHATBOT_LLM_TIMEOUT)
+  - retries with full-jitter exponential backoff, limited by a retry
+    budget so retries add at most CHATBOT_LLM_RETRY_RATIO extra load
+    while the provider is struggling
+  - hedging: if the primary hasn't answered by its observed p95 latency,
+    a duplicate goes to CHATBOT_LLM_SECONDARY_MODEL (or the primary
+    model again) and the first answer wins. A blocking call can't be
+    cancelled, so at most CHATBOT_LLM_MAX_HEDGES synchronous hedges (each
+    holding its slot until the losing call finishes too) run at once
+  - a circuit breaker that fails fast for CHATBOT_LLM_BREAKER_COOLDOWN
+    seconds after CHATBOT_LLM_BREAKER_FAILURES consecutive failures
+
+Streams get the deadline, retries and breaker up to their first token,
+but aren't hedged. Set CHATBOT_LLM_BASE_URL to point every model at a
+local server such as `python -m chatbot.stub_inference`.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+LLM_MODEL = os.getenv("CHATBOT_LLM_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+LLM_SECONDARY_MODEL = os.getenv("CHATBOT_LLM_SECONDARY_MODEL", "")  # hedge target; "" hedges to LLM_MODEL
+LLM_BASE_URL = os.getenv("CHATBOT_LLM_BASE_URL", "")
+LLM_TIMEOUT = float(os.getenv("CHATBOT_LLM_TIMEOUT", 15))
+LLM_MAX_ATTEMPTS = int(os.getenv("CHATBOT_LLM_MAX_ATTEMPTS", 3))
+LLM_RETRY_RATIO = float(os.getenv("CHATBOT_LLM_RETRY_RATIO", 0.2))
+LLM_HEDGE = os.getenv("CHATBOT_LLM_HEDGE", "1") != "0"
+LLM_MAX_HEDGES = int(os.getenv("CHATBOT_LLM_MAX_HEDGES", 4))
+LLM_BREAKER_FAILURES = int(os.getenv("CHATBOT_LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("CHATBOT_LLM_BREAKER_COOLDOWN", 30))
+
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+
+class LLMUnavailable(Exception):
+    """The call was not attempted (circuit open) or no attempt succeeded"""
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, 408/429 and 5xx are worth another try; other 4xx aren't"""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    return not isinstance(error, (ValueError, TypeError, KeyError, LLMUnavailable))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """
+    Every first attempt deposits `ratio` tokens and every retry spends one,
+    so over time retries are capped at `ratio` of the traffic (plus a small
+    reserve for quiet periods).
+    """
+
+    def __init__(self, ratio=LLM_RETRY_RATIO, reserve=3.0, cap=10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.balance = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.balance >= 1:
+                self.balance -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` in a row -> half-open after `cooldown` (one probe) -> closed"""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half-open"
+            if self.state == "closed":
+                return True
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def release(self):
+        """The admitted call ended with no outcome (cancelled): let the next call probe instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probing = False
+            if self.state == "half-open" or self.consecutive_failures >= self.failures:
+                if self.state != "open":
+                    print(f"⚡ LLM circuit open for {self.cooldown:g}s after "
+                          f"{self.consecutive_failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Recent successful call latencies, for the hedging threshold"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, min_samples=HEDGE_MIN_SAMPLES):
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def make_client(model, base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT, use_async=False):
+    """An InferenceClient (or AsyncInferenceClient) for `model`, optionally on a local server"""
+    from huggingface_hub import AsyncInferenceClient, InferenceClient
+
+    cls = AsyncInferenceClient if use_async else InferenceClient
+    token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    if base_url:
+        return cls(base_url=f"{base_url.rstrip('/')}/models/{model}/v1", token=token, timeout=timeout)
+    return cls(model, token=token, timeout=timeout)
+
+
+class ResilientLLM:
+    def __init__(self, primary, secondary=None, async_primary=None, async_secondary=None,
+                 timeout=LLM_TIMEOUT, max_attempts=LLM_MAX_ATTEMPTS, hedge=LLM_HEDGE,
+                 budget=None, breaker=None, max_hedges=LLM_MAX_HEDGES):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.async_primary = async_primary
+        self.async_secondary = async_secondary or async_primary
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        # Sync hedges whose calls (winner and loser) haven't all finished
+        self._hedge_slots = threading.BoundedSemaphore(max(1, max_hedges))
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-call")
+        self._stats_lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "failures": 0,
+            "short_circuited": 0, "budget_exhausted": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        secondary = LLM_SECONDARY_MODEL or LLM_MODEL
+        return cls(
+            make_client(LLM_MODEL),
+            make_client(secondary),
+            make_client(LLM_MODEL, use_async=True),
+            make_client(secondary, use_async=True),
+        )
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self):
+        """Seconds to wait for the primary before hedging, or None (not enough data / disabled)"""
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(HEDGE_PERCENTILE)
+        return None if p95 is None else max(HEDGE_MIN_DELAY, p95)
+
+    def _retry(self, attempt, error, deadline):
+        """Sleep before the next attempt, or re-raise when we shouldn't retry"""
+        if not is_retryable(error):
+            # The provider answered, it just didn't like the request
+            self.breaker.record_success()
+            self._count("failures")
+            raise error
+        self.breaker.record_failure()
+        if attempt == self.max_attempts - 1:
+            self._count("failures")
+            raise error
+        if not self.budget.withdraw():
+            self._count("budget_exhausted")
+            self._count("failures")
+            raise error
+        delay = backoff_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            self._count("failures")
+            raise error
+        self._count("retries")
+        return delay
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise LLMUnavailable("LLM circuit is open")
+
+    # --- sync ---
+
+    def _timed(self, client, messages, kwargs, record):
+        start = time.monotonic()
+        response = client.chat_completion(messages=messages, **kwargs)
+        if record:
+            self.latency.add(time.monotonic() - start)
+        return response
+
+    def _hedged_call(self, messages, kwargs):
+        delay = self.hedge_delay()
+        if delay is None:
+            # Nothing to hedge with: call on this thread, bounded by the client timeout
+            return self._timed(self.primary, messages, kwargs, True)
+
+        deadline = time.monotonic() + self.timeout
+        primary = self._executor.submit(self._timed, self.primary, messages, kwargs, True)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        if not self._hedge_slots.acquire(blocking=False):
+            # Enough losers are already tying up threads and provider capacity
+            self._count("hedges_skipped")
+            try:
+                return primary.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                if primary.done():
+                    raise  # the call itself timed out
+                raise TimeoutError(f"LLM call exceeded {self.timeout:.1f}s")
+
+        self._count("hedges")
+        secondary = self._executor.submit(self._timed, self.secondary, messages, kwargs, False)
+        self._release_when_done(primary, secondary)
+        pending, error = {primary, secondary}, None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"LLM call exceeded {self.timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        self._count("hedge_wins")
+                    # The loser keeps running in its thread; its result is ignored
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _release_when_done(self, *futures):
+        """Give the hedge slot back once every one of `futures` has finished"""
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._hedge_slots.release()
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def chat_completion(self, messages, stream=False, **kwargs):
+        """Same call as InferenceClient.chat_completion; raises LLMUnavailable when the circuit is open"""
+        if stream:
+            return self._stream(messages, kwargs)
+        self._count("calls")
+        self.budget.deposit()
+        deadline = time.monotonic() + self.timeout * self.max_attempts
+        for attempt in range(self.max_attempts):
+            self._admit()
+            try:
+                response = self._hedged_call(messages, kwargs)
+            except Exception as e:
+                time.sleep(self._retry(attempt, e, deadline))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return response
+
+    def _stream(self, messages, kwargs):
+        self._count("calls")
+        self.budget.deposit()
+        deadline = time.monotonic() + self.timeout * self.max_attempts
+        for attempt in range(self.max_attempts):
+            self._admit()
+            try:
+                stream = self.primary.chat_completion(messages=messages, stream=True, **kwargs)
+                iterator = iter(stream)
+                first = next(iterator, None)
+            except Exception as e:
+                time.sleep(self._retry(attempt, e, deadline))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return self._relay(stream, iterator, first)
+
+    @staticmethod
+    def _relay(stream, iterator, first):
+        try:
+            if first is not None:
+                yield first
+            for chunk in iterator:
+                yield chunk
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+
+    # --- async ---
+
+    async def _atimed(self, client, messages, kwargs, record):
+        start = time.monotonic()
+        response = await asyncio.wait_for(client.chat_completion(messages=messages, **kwargs), self.timeout)
+        if record:
+            self.latency.add(time.monotonic() - start)
+        return response
+
+    async def _ahedged_call(self, messages, kwargs):
+        primary = asyncio.ensure_future(self._atimed(self.async_primary, messages, kwargs, True))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self._count("hedges")
+            secondary = asyncio.ensure_future(self._atimed(self.async_secondary, messages, kwargs, False))
+            tasks.append(secondary)
+            pending, error = {primary, secondary}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also when we are cancelled: nobody would collect these
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def achat_completion(self, messages, **kwargs):
+        """Async chat_completion with the same deadline, retries, hedging and breaker"""
+        self._count("calls")
+        self.budget.deposit()
+        deadline = time.monotonic() + self.timeout * self.max_attempts
+        for attempt in range(self.max_attempts):
+            self._admit()
+            try:
+                response = await self._ahedged_call(messages, kwargs)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"LLM call exceeded {self.timeout:.1f}s")
+                await asyncio.sleep(self._retry(attempt, e, deadline))
+                continue
+            except BaseException:
+                # Cancelled (request deadline, client gone): no outcome to record, but a
+                # half-open probe must not stay in flight forever
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return response
+
+    def after_fork(self):
+        """In a forked child the parent's pool threads are gone; start with a fresh pool"""
+        self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-call")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counters)
+        p50, p95 = self.latency.percentile(50, 1), self.latency.percentile(95, 1)
+        stats.update(
+            breaker=self.breaker.state,
+            retry_budget=round(self.budget.balance, 2),
+            latency_p50=None if p50 is None else round(p50, 3),
+            latency_p95=None if p95 is None else round(p95, 3),
+            hedge_after=self.hedge_delay(),
+        )
+        return stats
@@ -0,0 +1,228 @@
+"""
+In-process metrics for the chat hot path.
+
+Stages are timed with spans and land in per-stage histograms; events
+(cache hits, refinements, fallbacks, LLM errors, ...) are plain counters:
+
+    with METRICS.span("retrieve"):
+        ...
+    METRICS.count("fallbacks")
+
+    @METRICS.timed("llm")          # also works on coroutine functions
+    def call_llm(...): ...
+
+Each histogram keeps cumulative bucket counts (exported in Prometheus
+text format) and a rolling window of the latest samples, from which the
+JSON snapshot computes p50/p95/p99. Recording a sample is one bisect and
+a few additions under a lock, so spans are cheap enough to leave on;
+CHATBOT_METRICS=0 turns them into no-ops.
+
+A request can also be run under cProfile (`profiled()`), either because
+it carries the X-Chatbot-Profile header with the CHATBOT_PROFILE_TOKEN
+value, or because it was sampled (CHATBOT_PROFILE_SAMPLE, a fraction).
+cProfile only sees the calling thread, so time spent waiting on the LLM
+in the client's hedging pool shows up as waiting.
+"""
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+
+METRICS_ENABLED = os.getenv("CHATBOT_METRICS", "1") != "0"
+METRICS_WINDOW = int(os.getenv("CHATBOT_METRICS_WINDOW", 1024))
+# Seconds; the +Inf bucket is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROFILE_HEADER = "X-Chatbot-Profile"
+PROFILE_TOKEN = os.getenv("CHATBOT_PROFILE_TOKEN")  # unset: the header is ignored
+PROFILE_SAMPLE = float(os.getenv("CHATBOT_PROFILE_SAMPLE", 0))
+PROFILE_TOP = int(os.getenv("CHATBOT_PROFILE_TOP", 25))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS, window=METRICS_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        """Totals plus percentiles (in ms) over the rolling window"""
+        with self._lock:
+            recent = sorted(self.recent)
+            count, total = self.count, self.sum
+        if not recent:
+            return {"count": count}
+
+        def pct(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3)
+
+        return {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 3),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(recent[-1] * 1000, 3),
+        }
+
+    def cumulative(self):
+        """[(upper bound, cumulative count)], ending with +Inf; plus sum and count"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        running, rows = 0, []
+        for bound, n in zip(list(self.buckets) + [float("inf")], counts):
+            running += n
+            rows.append((bound, running))
+        return rows, total, count
+
+
+class Metrics:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the block into `stage`'s histogram (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator form of span(), for plain and coroutine functions"""
+        def decorate(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_timed(*args, **kwargs):
+                    with self.span(stage):
+                        return await func(*args, **kwargs)
+                return async_timed
+
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return timed
+        return decorate
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        return {
+            "counters": counters,
+            "stages": {stage: histograms[stage].snapshot() for stage in sorted(histograms)},
+        }
+
+    def prometheus(self, gauges=None, prefix="chatbot"):
+        """
+        Prometheus text exposition: stage histograms, event counters, and
+        `gauges` ({section: {name: number}}, e.g. the existing stats dicts).
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage in sorted(histograms):
+            rows, total, count = histograms[stage].cumulative()
+            for bound, n in rows:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {n}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name in sorted(counters):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {counters[name]}')
+
+        for section, values in (gauges or {}).items():
+            for name, value in sorted(values.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    metric = _metric_name(f"{prefix}_{section}_{name}")
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def profile_requested(header_value):
+    """The request carries the profiling header with the right token"""
+    return bool(PROFILE_TOKEN) and header_value == PROFILE_TOKEN
+
+
+def should_profile(header_value=None):
+    """Profile this request: asked for with the right token, or sampled"""
+    if profile_requested(header_value):
+        return True
+    return PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE
+
+
+@contextmanager
+def profiled(enabled, top=PROFILE_TOP):
+    """
+    Run the block under cProfile when `enabled`. Yields a dict that gets
+    a "profile" entry (the top functions by cumulative time) at the end.
+    """
+    result = {}
+    if not enabled:
+        yield result
+        return
+
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        result["profile"] = out.getvalue()
+
+
+METRICS = Metrics()
@@ -0,0 +1,91 @@
+"""
+Helpers for pre-fork serving (see `python -m api._server --processes N`).
+
+The parent builds the Chatbot once and forks the workers, so the model
+weights, vectors and everything else built at startup are shared
+copy-on-write instead of loaded N times. Pages only stay shared while
+no process writes to them, and CPython writes a lot: every reference
+count change and every GC pass touches object headers. So before forking:
+
+  - vector arrays and the phrase matrix move into their own page-aligned
+    anonymous shared mappings (a memory-mapped index already is one), so
+    the only thing sharing a page with their data is more of their data;
+  - torch weights go to shared memory (Module.share_memory());
+  - everything else is gc.freeze()'d, so collections in the workers
+    never walk (and dirty) the parent's objects.
+
+After the fork each worker restarts the threads the parent had running
+(threads don't survive a fork). memory_usage() reads smaps_rollup, so the
+sharing can be checked: a worker's USS (pages only it holds) should stay
+well below its RSS.
+"""
+import gc
+import mmap
+
+import numpy as np
+
+
+def share_array(array):
+    """Read-only copy of `array` in its own anonymous shared mapping (memory-mapped arrays are returned as is)"""
+    if array is None or isinstance(array, np.memmap) or array.nbytes == 0:
+        return array
+    array = np.ascontiguousarray(array)
+    buffer = mmap.mmap(-1, array.nbytes)
+    shared = np.frombuffer(buffer, dtype=array.dtype).reshape(array.shape)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared
+
+
+def _share_model(embeddings):
+    """Put torch weights of the embedding backend (unwrapping the batcher) in shared memory"""
+    backend = getattr(embeddings, "base", embeddings)
+    model = getattr(backend, "model", None)
+    if hasattr(model, "share_memory"):
+        model.share_memory()
+        return True
+    return False
+
+
+def prepare_for_fork(chatbot):
+    """Lay out the Chatbot's big read-only data for sharing, then freeze the heap"""
+    store = chatbot.docsearch
+    store.vectors = share_array(store.vectors)
+    store.scales = share_array(store.scales)
+    chatbot.guardrail.phrase_matrix = share_array(chatbot.guardrail.phrase_matrix)
+    chatbot.problematic_embeddings = share_array(np.asarray(chatbot.problematic_embeddings, dtype=np.float32))
+    shared_model = _share_model(chatbot.embeddings_model)
+
+    gc.collect()
+    gc.freeze()
+    print(f"🧊 Prepared for fork: {len(store)} vectors shared, model weights "
+          f"{'in shared memory' if shared_model else 'copy-on-write'}, {gc.get_freeze_count()} objects frozen")
+
+
+def after_fork(chatbot):
+    """In a freshly forked worker: restart the background threads and pools"""
+    chatbot.after_fork()
+
+
+def memory_usage(pid="self"):
+    """
+    {"rss", "pss", "uss", "shared"} in MB from /proc/<pid>/smaps_rollup.
+    USS is what the process would free by exiting; PSS splits shared pages
+    between their users. None where /proc isn't available.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "rss": mb(fields.get("Rss", 0)),
+        "pss": mb(fields.get("Pss", 0)),
+        "uss": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+        "shared": mb(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)),
+    }
@@ -0,0 +1,208 @@
+"""
+Token-budgeted prompt assembly.
+
+Every token we send costs LLM latency, so the prompt is built against a
+budget (CHATBOT_PROMPT_TOKEN_BUDGET) counted with the model's own
+tokenizer:
+
+  1. Retrieved chunks that are neighbours in the same file are merged,
+     dropping the text they share because of the splitter's chunk_overlap.
+  2. History is kept newest-first within its share of the budget, so the
+     oldest turns go first.
+  3. Context is added best retrieval score first; whatever doesn't fit is
+     dropped (the best chunk alone is truncated rather than dropped).
+  4. Budget the context didn't use goes back to older history.
+
+The tokenizer is the Llama tokenizer.json from the Hub cache (downloaded
+once), or CHATBOT_TOKENIZER_PATH. Without either, or with
+CHATBOT_TOKENIZER_PATH=estimate, tokens are estimated from the character
+count.
+"""
+import os
+import re
+from functools import lru_cache
+
+from chatbot.vector_store import Chunk
+
+
+TOKENIZER_REPO = "meta-llama/Llama-3.1-8B-Instruct"
+TOKENIZER_PATH = os.getenv("CHATBOT_TOKENIZER_PATH")
+PROMPT_TOKEN_BUDGET = int(os.getenv("CHATBOT_PROMPT_TOKEN_BUDGET", 1200))
+HISTORY_SHARE = 0.3   # of the budget left after the template and question
+HISTORY_LINES = 6
+MAX_OVERLAP_CHARS = 200
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """Counts and truncates with a `tokenizers` Tokenizer, or estimates from characters"""
+
+    def __init__(self, tokenizer=None, name="estimate"):
+        self.tokenizer = tokenizer
+        self.name = name
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        ids = self.tokenizer.encode(text, add_special_tokens=False).ids
+        return text if len(ids) <= max_tokens else self.tokenizer.decode(ids[:max_tokens])
+
+
+@lru_cache(maxsize=1)
+def load_token_counter(path=TOKENIZER_PATH, repo_id=TOKENIZER_REPO, local_only=False):
+    """
+    The model's tokenizer, from `path`, the local Hub cache, or the Hub
+    (cached after). `local_only` never touches the network.
+    """
+    if path == "estimate":
+        return TokenCounter()
+    try:
+        from tokenizers import Tokenizer
+
+        if not path:
+            from huggingface_hub import hf_hub_download
+
+            token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+            try:
+                path = hf_hub_download(repo_id, "tokenizer.json", token=token, local_files_only=True)
+            except Exception:
+                if local_only:
+                    raise
+                path = hf_hub_download(repo_id, "tokenizer.json", token=token)
+        return TokenCounter(Tokenizer.from_file(path), name=repo_id)
+    except Exception as e:
+        print(f"⚠️ Tokenizer unavailable ({e}); estimating prompt tokens from length")
+        return TokenCounter()
+
+
+def _chunk_position(chunk):
+    """(file, index) from a 'file#index' chunk ID, or None"""
+    source, _, index = chunk.id.rpartition("#")
+    return (source, int(index)) if source and index.isdigit() else None
+
+
+def _overlap(left, right, limit=MAX_OVERLAP_CHARS):
+    """Length of the longest suffix of `left` that is a prefix of `right`"""
+    for size in range(min(len(left), len(right), limit), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent(scored_chunks):
+    """
+    Merge chunks that are consecutive pieces of the same file into one,
+    without the overlapping text. Keeps the best-first order of the input,
+    a merged chunk taking the best score of its parts.
+    """
+    by_position = {}
+    for chunk, score in scored_chunks:
+        position = _chunk_position(chunk)
+        if position is not None:
+            by_position[position] = (chunk, score)
+
+    merged, consumed = [], set()
+    for chunk, score in scored_chunks:
+        position = _chunk_position(chunk)
+        if position in consumed:
+            continue
+        if position is None:
+            merged.append((chunk, score))
+            continue
+
+        # Walk back to the first piece of the run, then forward to its end
+        source, index = position
+        while (source, index - 1) in by_position and (source, index - 1) not in consumed:
+            index -= 1
+        first, best = by_position[(source, index)]
+        text, ids = first.page_content, [first.id]
+        consumed.add((source, index))
+        while (source, index + 1) in by_position and (source, index + 1) not in consumed:
+            index += 1
+            piece, piece_score = by_position[(source, index)]
+            shared = _overlap(text, piece.page_content)
+            text += piece.page_content[shared:] if shared else "\n" + piece.page_content
+            ids.append(piece.id)
+            best = max(best, piece_score)
+            consumed.add((source, index))
+
+        merged.append((Chunk("+".join(ids), text, dict(first.metadata)), best))
+
+    return sorted(merged, key=lambda item: -item[1])
+
+
+class PromptBuilder:
+    def __init__(self, template, counter, budget=PROMPT_TOKEN_BUDGET, history_lines=HISTORY_LINES):
+        self.template = template
+        self.counter = counter
+        self.budget = budget
+        self.history_lines = history_lines
+        self.template_tokens = counter.count(
+            re.sub(r"\{(context|question|conversation_history)\}", "", template)
+        )
+
+    def build(self, question, history, scored_chunks):
+        """
+        Returns (prompt_text, stats) for `history` (oldest first, already
+        ending with the user turn) and [(Chunk, score)] best first.
+        """
+        count = self.counter.count
+        available = max(0, self.budget - self.template_tokens - count(question))
+
+        # Newest history first, within its share
+        lines = history[-self.history_lines:]
+        line_tokens = [count(line) + 1 for line in lines]
+        history_budget = int(available * HISTORY_SHARE)
+        kept_from = len(lines)
+        used = 0
+        while kept_from > 0 and used + line_tokens[kept_from - 1] <= history_budget:
+            kept_from -= 1
+            used += line_tokens[kept_from]
+        history_tokens = used
+
+        # Best-scoring context next
+        chunks = merge_adjacent(scored_chunks)
+        context_budget = available - history_tokens
+        context, context_tokens = [], 0
+        for chunk, _ in chunks:
+            tokens = count(chunk.page_content) + 2
+            if context_tokens + tokens <= context_budget:
+                context.append(chunk.page_content)
+                context_tokens += tokens
+            elif not context:
+                text = self.counter.truncate(chunk.page_content, context_budget - 2)
+                if text:
+                    context.append(text)
+                    context_tokens += count(text) + 2
+
+        # Give what the context left over to older history
+        leftover = available - context_tokens - history_tokens
+        while kept_from > 0 and line_tokens[kept_from - 1] <= leftover:
+            kept_from -= 1
+            leftover -= line_tokens[kept_from]
+            history_tokens += line_tokens[kept_from]
+
+        prompt_text = self.template.format(
+            context="\n\n".join(context),
+            question=question,
+            conversation_history="\n".join(lines[kept_from:])
+        )
+        stats = {
+            "prompt_tokens": count(prompt_text),
+            "context_tokens": context_tokens,
+            "history_tokens": history_tokens,
+            "chunks": len(context),
+            "chunks_merged": len(scored_chunks) - len(chunks),
+            "chunks_dropped": len(chunks) - len(context),
+            "history_dropped": kept_from,
+        }
+        return prompt_text, stats
@@ -0,0 +1,174 @@
+"""
+Hybrid lexical + dense retrieval.
+
+Dense search alone misses name-heavy questions ("Rutgers", an employer's
+name) whose embeddings are dominated by the rest of the sentence, and it
+can't run at all until the embedding model is loaded. So next to the
+vector store we keep an in-memory BM25 inverted index over the same
+chunks and merge both rankings with reciprocal rank fusion:
+
+    score(chunk) = sum over rankings of 1 / (RRF_K + rank)
+
+Modes: "hybrid" (default), "dense", or "lexical", which needs no query
+embedding and is used while the model warms up or the CPU is saturated.
+Chunks that repeat text already selected (splitter overlap, paragraphs
+copied between context files) are dropped before prompt assembly. With
+`diversity` > 0 the final k are picked by maximal marginal relevance
+instead of by fused score alone (see mmr_select).
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+RRF_K = 60
+CANDIDATES_PER_K = 3  # each ranking contributes k * this many candidates
+DUPLICATE_CONTAINMENT = 0.8
+MODES = ("hybrid", "dense", "lexical")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have he her his how i if in into is it its "
+    "me my of on or our she so that the their them they this to was we were what when where which who "
+    "why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.doc_lengths = []
+
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+
+        n = len(self.doc_lengths)
+        self.avg_length = (sum(self.doc_lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query, k=4):
+        """[(doc index, score)] best first; documents sharing no query term are left out"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[i] / (self.avg_length or 1)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked lists of keys into [(key, fused score)], best first"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def _shingles(text, n=3):
+    words = TOKEN_PATTERN.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def dedupe_chunks(scored_chunks, threshold=DUPLICATE_CONTAINMENT):
+    """
+    Drop chunks whose word 3-grams are mostly contained in a chunk kept
+    earlier in the (best-first) list.
+    """
+    kept, kept_shingles = [], []
+    for chunk, score in scored_chunks:
+        shingles = _shingles(chunk.page_content)
+        if any(len(shingles & other) >= threshold * len(shingles) for other in kept_shingles):
+            continue
+        kept.append((chunk, score))
+        kept_shingles.append(shingles)
+    return kept
+
+
+def mmr_select(scores, vectors, k, diversity):
+    """
+    Maximal marginal relevance: repeatedly pick the candidate maximizing
+
+        (1 - diversity) * relevance - diversity * max cosine to those picked
+
+    where relevance is the candidate's score scaled to [0, 1]. `vectors`
+    are the candidates' unit embeddings. Returns positions into `scores`.
+    """
+    relevance = np.asarray(scores, dtype=np.float32)
+    relevance = relevance / (relevance.max() or 1.0)
+    similarity = vectors @ vectors.T
+    picked = [int(np.argmax(relevance))]
+    redundancy = similarity[picked[0]].copy()
+    while len(picked) < min(k, len(scores)):
+        mmr = (1 - diversity) * relevance - diversity * redundancy
+        mmr[picked] = -np.inf
+        best = int(np.argmax(mmr))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
+
+
+class HybridRetriever:
+    """BM25 + vector store over the same chunks; rebuilt whenever the store is swapped"""
+
+    def __init__(self, store, mode="hybrid"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {MODES}")
+        self.store = store
+        self.mode = mode
+        self.lexical = BM25Index(store.texts)
+        self.positions = {chunk_id: i for i, chunk_id in enumerate(store.ids)}
+
+    def search_with_scores(self, query, query_embedding=None, k=4, mode=None, diversity=0.0):
+        """
+        Top-k [(Chunk, score)] after fusion and de-duplication (and MMR when
+        `diversity` > 0). Without a query embedding only the lexical ranking
+        is used.
+        """
+        mode = mode or self.mode
+        if query_embedding is None:
+            mode = "lexical"
+        candidates = k * CANDIDATES_PER_K
+
+        rankings = []
+        if mode in ("hybrid", "dense"):
+            dense = self.store.similarity_search_with_score_by_vector(query_embedding, candidates)
+            rankings.append([chunk.id for chunk, _ in dense])
+        if mode in ("hybrid", "lexical"):
+            lexical = self.lexical.search(query, candidates)
+            rankings.append([self.store.ids[i] for i, _ in lexical])
+
+        fused = [
+            (self.store.chunk(self.positions[chunk_id]), score)
+            for chunk_id, score in reciprocal_rank_fusion(rankings)
+        ]
+        candidates = dedupe_chunks(fused)
+        if diversity <= 0 or len(candidates) <= k:
+            return candidates[:k]
+        vectors = self.store.rows([self.positions[chunk.id] for chunk, _ in candidates])
+        picked = mmr_select([score for _, score in candidates], vectors, k, diversity)
+        return [candidates[i] for i in picked]
+
+    def search(self, query, query_embedding=None, k=4, mode=None, diversity=0.0):
+        return [chunk for chunk, _ in self.search_with_scores(query, query_embedding, k, mode, diversity)]
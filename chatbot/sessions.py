@@ -0,0 +1,247 @@
+"""
+Per-visitor conversation history.
+
+Each browser sends a session ID with its chat requests; its turns are kept
+apart from everyone else's so one visitor's questions never leak into
+another visitor's prompt. Histories live in a bounded LRU with an idle TTL
+and an approximate per-process memory cap. The backend is pluggable: the
+default keeps sessions in process memory, SQLiteBackend stores them in a
+local file so several workers on one machine can share them.
+
+A request without a session ID is stateless: nothing is loaded for it and
+nothing is kept, rather than pooling every such visitor in one history.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+SESSION_TTL = float(os.getenv("CHATBOT_SESSION_TTL", 30 * 60))
+MAX_SESSIONS = int(os.getenv("CHATBOT_SESSION_MAX", 1000))
+MAX_SESSION_BYTES = int(os.getenv("CHATBOT_SESSION_MAX_BYTES", 8 * 1024 * 1024))
+
+
+def history_size(history):
+    """Approximate memory held by a history (payload bytes only)"""
+    return sum(len(line.encode("utf-8")) for line in history)
+
+
+class SessionBackend:
+    """Storage interface for session histories"""
+
+    def get(self, session_id):
+        """Return the stored history list, or None if unknown/expired"""
+        raise NotImplementedError
+
+    def set(self, session_id, history):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def stats(self):
+        """Dict with at least `resident` and `evictions`"""
+        raise NotImplementedError
+
+
+class MemoryBackend(SessionBackend):
+    """In-process LRU with idle TTL, a session count cap and a byte cap"""
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, max_bytes=MAX_SESSION_BYTES):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # session_id -> (last_used, size, history)
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, session_id):
+        _, size, _ = self._sessions.pop(session_id)
+        self._bytes -= size
+
+    def _evict(self, now):
+        # Oldest entries sit at the front of the OrderedDict
+        while self._sessions:
+            session_id, (last_used, _, _) = next(iter(self._sessions.items()))
+            over_limit = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not over_limit and now - last_used <= self.ttl:
+                break
+            self._pop(session_id)
+            self._evictions += 1
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            last_used, size, history = entry
+            if now - last_used > self.ttl:
+                self._pop(session_id)
+                self._evictions += 1
+                return None
+            self._sessions[session_id] = (now, size, history)
+            self._sessions.move_to_end(session_id)
+            return list(history)
+
+    def set(self, session_id, history):
+        now = time.time()
+        history = list(history)
+        size = history_size(history)
+        with self._lock:
+            if session_id in self._sessions:
+                self._pop(session_id)
+            self._sessions[session_id] = (now, size, history)
+            self._bytes += size
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._pop(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident": len(self._sessions),
+                "bytes": self._bytes,
+                "evictions": self._evictions,
+            }
+
+
+class SQLiteBackend(SessionBackend):
+    """Sessions in a local SQLite file, shared by every worker that opens it"""
+
+    def __init__(self, path, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, history TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions(last_used)")
+
+    def after_fork(self):
+        """A forked worker must not reuse the parent's connections"""
+        self._local = threading.local()
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT history, last_used FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._evictions += 1
+                return None
+            conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id))
+            return json.loads(row[0])
+
+    def set(self, session_id, history):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, history, last_used) VALUES (?, ?, ?)",
+                (session_id, json.dumps(list(history)), now)
+            )
+            expired = conn.execute(
+                "DELETE FROM sessions WHERE last_used < ?", (now - self.ttl,)
+            ).rowcount
+            overflow = conn.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                "SELECT id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            ).rowcount
+            self._evictions += expired + overflow
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def stats(self):
+        with self._connect() as conn:
+            resident, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(history)), 0) FROM sessions"
+            ).fetchone()
+        return {"resident": resident, "bytes": size, "evictions": self._evictions}
+
+
+class SessionStore:
+    """Front for a backend that also counts hits and misses"""
+
+    def __init__(self, backend=None, lock_stripes=64):
+        self.backend = backend or MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Serialize read-modify-write per session without one global lock
+        self._turn_locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def load(self, session_id):
+        """History for a session (a fresh list the caller may mutate); [] without a session ID"""
+        if not session_id:
+            return []
+        history = self.backend.get(session_id)
+        with self._lock:
+            if history is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return history or []
+
+    def save(self, session_id, history):
+        if session_id:
+            self.backend.set(session_id, history)
+
+    def append(self, session_id, lines, keep=None):
+        """
+        Atomically add `lines` to the stored history (keeping the last
+        `keep`), so concurrent turns in one session don't overwrite each other.
+        """
+        if not session_id:
+            return list(lines)[-keep:] if keep else list(lines)
+        with self._turn_locks[hash(session_id) % len(self._turn_locks)]:
+            history = (self.backend.get(session_id) or []) + list(lines)
+            if keep:
+                del history[:-keep]
+            self.backend.set(session_id, history)
+        return history
+
+    def after_fork(self):
+        if hasattr(self.backend, "after_fork"):
+            self.backend.after_fork()
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats.update(hits=self.hits, misses=self.misses)
+        return stats
+
+
+def create_session_store():
+    """Build the store selected by CHATBOT_SESSION_BACKEND (memory | sqlite)"""
+    backend = os.getenv("CHATBOT_SESSION_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("CHATBOT_SESSION_DB", "chatbot/sessions.sqlite3")
+        print(f"🗂️ Using SQLite session store at {path}")
+        return SessionStore(SQLiteBackend(path))
+    return SessionStore(MemoryBackend())
@@ -0,0 +1,129 @@
+"""
+Coalescing of identical in-flight requests ("singleflight").
+
+When a shared link sends a burst of visitors who all click the same
+suggested question, only the first request (the leader) calls the LLM;
+the duplicates that arrive while it is running wait for it and get its
+answer, or its exception. Once the call finishes the key is forgotten,
+so later duplicates are served by the answer cache instead.
+
+Chatbot keys calls by the normalized question plus the index version and
+only coalesces opening questions, whose prompt doesn't depend on history.
+"""
+import asyncio
+import re
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """A follower gave up waiting for the leader's result"""
+
+
+class SingleFlightAbandoned(Exception):
+    """The leader stopped before producing a result (e.g. its client disconnected)"""
+
+
+def normalize_question(text):
+    """Case, whitespace and trailing punctuation don't change the question"""
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}  # async calls: key -> asyncio.Task
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def begin(self, key):
+        """
+        Join the call for `key`, starting one if none is running.
+        Returns (call, is_leader); the leader must call finish().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.counters["coalesced"] += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.counters["calls"] += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's result (or exception) to everyone waiting on it"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if error is not None:
+                self.counters["errors"] += 1
+        call.result, call.error = result, error
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        """Follower side: the leader's result, re-raising its exception"""
+        if not call.done.wait(timeout):
+            self._count("timeouts")
+            raise SingleFlightTimeout(f"no result after {timeout}s")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once for all concurrent callers with the same key. Returns (result, shared)."""
+        call, leader = self.begin(key)
+        if not leader:
+            try:
+                return self.wait(call, timeout), True
+            except SingleFlightAbandoned:
+                return self.do(key, fn, timeout)  # nobody is answering any more: take over
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, False
+
+    async def ado(self, key, coro_fn, timeout=None):
+        """
+        Async do(): the call runs as its own task, so a caller that times out
+        or is cancelled doesn't cancel it for the others. Returns (result, shared).
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            shared = task is not None
+            if shared:
+                self.counters["coalesced"] += 1
+            else:
+                self.counters["calls"] += 1
+                task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+                task.add_done_callback(lambda t: self._forget(key, t))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), shared
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise SingleFlightTimeout(f"no result after {timeout}s")
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            if not task.cancelled() and task.exception() is not None:
+                self.counters["errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "in_flight": len(self._calls) + len(self._tasks)}
@@ -0,0 +1,202 @@
+"""
+Local stand-in for the hosted inference API.
+
+Speaks the OpenAI-style chat completion protocol InferenceClient uses
+(plain JSON and streamed SSE), with configurable latency, tail latency
+and error rate, so the LLM client's timeouts, retries, hedging and
+circuit breaker can be exercised without the real endpoint:
+
+    python -m chatbot.stub_inference --port 8081 --latency 0.3 --tail-rate 0.05 --error-rate 0.1
+    CHATBOT_LLM_BASE_URL=http://127.0.0.1:8081 python -m chatbot.chat
+
+Requests go to /models/<model>/v1/chat/completions (see llm_client.py),
+so each model can be given its own behaviour.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubBehaviour:
+    """How one model responds; all times in seconds"""
+
+    def __init__(self, latency=0.2, jitter=0.05, tail_rate=0.0, tail_latency=5.0, error_rate=0.0,
+                 error_status=503, answer=None, token_delay=0.01, meta_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.answer = answer
+        self.token_delay = token_delay
+        self.meta_rate = meta_rate  # answers that leak "based on the documents", for the guardrail
+
+    def delay(self):
+        if random.random() < self.tail_rate:
+            return self.tail_latency
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+
+def _question(messages):
+    """The question of a chatbot prompt, or the last line of the last message"""
+    text = messages[-1]["content"] if messages else ""
+    match = re.search(r"Question: (.*)", text)
+    return (match.group(1) if match else text.strip().splitlines()[-1] if text.strip() else "").strip()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up on slow responses (timeouts, lost hedges) are expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StubInferenceServer:
+    """
+    In-process stub server. `behaviours` maps model name -> StubBehaviour;
+    unknown models use `default`. `requests` counts calls per model.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, default=None, behaviours=None):
+        self.default = default or StubBehaviour()
+        self.behaviours = dict(behaviours or {})
+        self.requests = {}
+        self._lock = threading.Lock()
+        self.httpd = _QuietServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-inference", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def behaviour(self, model):
+        return self.behaviours.get(model, self.default)
+
+    def _count(self, model):
+        with self._lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._json(200, {"status": "ok", "requests": server.requests})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": "not found"})
+                payload = json.loads(body or b"{}")
+                match = re.match(r"/models/(.+)/v1/chat/completions", self.path)
+                model = match.group(1) if match else str(payload.get("model") or "default")
+                server._count(model)
+
+                behaviour = server.behaviour(model)
+                time.sleep(behaviour.delay())
+                if random.random() < behaviour.error_rate:
+                    return self._json(behaviour.error_status, {"error": "stub failure"})
+
+                answer = behaviour.answer or f"Stub answer from {model} to: {_question(payload.get('messages', []))}"
+                if random.random() < behaviour.meta_rate:
+                    answer = f"Based on the documents I have, I can answer that. {answer}"
+                if payload.get("stream"):
+                    return self._stream(model, answer, behaviour.token_delay)
+                self._json(200, {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(answer.split()), "total_tokens": 0}
+                })
+
+            def _stream(self, model, answer, token_delay):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                words = answer.split(" ")
+                for i, word in enumerate(words):
+                    chunk = {
+                        "id": "stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"role": "assistant", "content": word + (" " if i < len(words) - 1 else "")},
+                            "finish_reason": None
+                        }]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(token_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _json(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the inference API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of very slow responses")
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--meta-rate", type=float, default=0.0, help="fraction of answers with meta-commentary")
+    args = parser.parse_args()
+
+    server = StubInferenceServer(args.host, args.port, StubBehaviour(
+        args.latency, args.jitter, args.tail_rate, args.tail_latency, args.error_rate, args.error_status,
+        meta_rate=args.meta_rate
+    ))
+    print(f"🧪 Stub inference API on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
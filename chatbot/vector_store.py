@@ -0,0 +1,189 @@
+"""
+Compact exact-search vector store.
+
+The whole corpus is a few dozen chunks, so FAISS and langchain's docstore
+are far more machinery than retrieval needs. This store keeps:
+
+    vectors.npy   unit-normalized chunk embeddings, float16 (or int8)
+    scales.npy    per-row dequantization scales (int8 only)
+    chunks.json   chunk IDs, source paths and texts
+
+At load time the vector file is memory-mapped, and a query is one matvec
+followed by a top-k partial sort. Because rows are unit-normalized the
+ranking matches FAISS's L2 search over the same normalized embeddings.
+
+It implements the small slice of the FAISS vectorstore API the chatbot
+uses (similarity_search_by_vector, delete, save_local), so it is a drop-in
+replacement for it.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+CHUNKS_FILE = "chunks.json"
+DTYPES = ("float16", "int8")
+
+
+class Chunk:
+    """Minimal stand-in for a langchain Document"""
+    __slots__ = ("id", "page_content", "metadata")
+
+    def __init__(self, id, page_content, metadata=None):
+        self.id = id
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+    def __repr__(self):
+        return f"Chunk({self.id!r}, {self.page_content[:40]!r}...)"
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors, dtype):
+    """Unit-normalize and store as float16, or as int8 with one scale per row"""
+    vectors = normalize_rows(vectors)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1)
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None] * 127).astype(np.int8), (scales / 127).astype(np.float32)
+    raise ValueError(f"Unsupported index dtype {dtype!r}, expected one of {DTYPES}")
+
+
+def _replace_npy(path, array):
+    tmp_path = str(path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class CompactVectorStore:
+    def __init__(self, vectors, scales, ids, sources, texts):
+        self.vectors = vectors      # (N, D) float16 or int8, possibly memory-mapped
+        self.scales = scales        # (N,) float32 for int8, else None
+        self.ids = list(ids)
+        self.sources = list(sources)
+        self.texts = list(texts)
+
+    @classmethod
+    def from_embeddings(cls, docs, ids, embeddings_list, dtype="float16"):
+        """Build from split documents (anything with page_content/metadata) and their embeddings"""
+        if len(docs):
+            vectors, scales = quantize(embeddings_list, dtype)
+        else:
+            vectors, scales = np.zeros((0, 0), dtype=dtype), (np.zeros(0, np.float32) if dtype == "int8" else None)
+        return cls(
+            vectors,
+            scales,
+            ids,
+            [doc.metadata.get("source", "") for doc in docs],
+            [doc.page_content for doc in docs]
+        )
+
+    @property
+    def dtype(self):
+        return "int8" if self.scales is not None else "float16"
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """Exact top-k by cosine similarity: [(Chunk, score)], best first"""
+        if not self.ids:
+            return []
+        query = normalize_rows(embedding)[0]
+        # Upcast per query: BLAS has no float16/int8 matvec, and N is tiny
+        scores = self.vectors.astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales
+
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk(i), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return [chunk for chunk, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def rows(self, positions):
+        """Dequantized float32 vectors of the given rows"""
+        positions = list(positions)
+        vectors = self.vectors[positions].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[positions][:, None]
+        return vectors
+
+    def chunk(self, i):
+        return Chunk(self.ids[i], self.texts[i], {"source": self.sources[i]})
+
+    def copy(self):
+        """In-memory copy that can be modified without touching the mapped files"""
+        return CompactVectorStore(
+            np.array(self.vectors),
+            None if self.scales is None else np.array(self.scales),
+            self.ids, self.sources, self.texts
+        )
+
+    def delete(self, ids):
+        """Drop chunks by ID (in place)"""
+        drop = set(ids)
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in drop]
+        self.vectors = self.vectors[keep]
+        if self.scales is not None:
+            self.scales = self.scales[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.sources = [self.sources[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        return True
+
+    def add_embeddings(self, docs, ids, embeddings_list):
+        """Append already-embedded documents (in place)"""
+        if not len(docs):
+            return
+        vectors, scales = quantize(embeddings_list, self.dtype)
+        self.vectors = np.concatenate([self.vectors, vectors]) if len(self.ids) else vectors
+        if scales is not None:
+            self.scales = np.concatenate([self.scales, scales]) if len(self.ids) else scales
+        self.ids.extend(ids)
+        self.sources.extend(doc.metadata.get("source", "") for doc in docs)
+        self.texts.extend(doc.page_content for doc in docs)
+
+    def save_local(self, folder):
+        """
+        Write the store. Every file goes through a temp file + os.replace so a
+        store that is still memory-mapping the old files keeps working.
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        _replace_npy(folder / VECTORS_FILE, np.ascontiguousarray(self.vectors))
+        if self.scales is not None:
+            _replace_npy(folder / SCALES_FILE, self.scales)
+        elif (folder / SCALES_FILE).exists():
+            os.remove(folder / SCALES_FILE)
+
+        tmp_path = folder / (CHUNKS_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "sources": self.sources, "texts": self.texts}, f)
+        os.replace(tmp_path, folder / CHUNKS_FILE)
+
+    @classmethod
+    def load_local(cls, folder, mmap=True):
+        folder = Path(folder)
+        vectors = np.load(folder / VECTORS_FILE, mmap_mode="r" if mmap else None)
+        scales = np.load(folder / SCALES_FILE) if vectors.dtype == np.int8 else None
+        with open(folder / CHUNKS_FILE, encoding="utf-8") as f:
+            chunks = json.load(f)
+        return cls(vectors, scales, chunks["ids"], chunks["sources"], chunks["texts"])
@@ -106,13 +106,35 @@ document.getElementById('contactForm').addEventListener('submit', async function
 });
 
 
-// Chatbot UI disabled (backend still available). All chat handlers are no-ops to avoid runtime errors.
+// Per-tab chat session so the backend keeps each visitor's conversation separate
+function getChatSessionId() {
+    let sessionId = sessionStorage.getItem('chatSessionId');
+    if (!sessionId) {
+        sessionId = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        sessionStorage.setItem('chatSessionId', sessionId);
+    }
+    return sessionId;
+}
+
+// Chatbot UI disabled (backend still available). UI handlers are no-ops to avoid runtime errors.
 function openChat() {}
 function closeChat() {}
 function addMessage() {}
 function showTyping() {}
 function hideTyping() {}
-async function sendMessage() { return null; }
+
+async function sendMessage(message) {
+    if (!message) { return null; }
+    const response = await fetch('/api/chat', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({message: message, session_id: getChatSessionId()})
+    });
+    const result = await response.json();
+    return result.response;
+}
 
 document.addEventListener('DOMContentLoaded', function() {
     // Chat UI disabled: no event bindings.
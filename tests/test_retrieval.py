@@ -0,0 +1,25 @@
+import numpy as np
+
+from chatbot.retrieval import HybridRetriever
+from chatbot.vector_store import Chunk, CompactVectorStore
+
+
+def make_store(dtype):
+    rng = np.random.default_rng(0)
+    texts = [f"project {i} used python and machine learning" for i in range(12)]
+    docs = [Chunk(f"doc.txt#{i}", text, {"source": "doc.txt"}) for i, text in enumerate(texts)]
+    vectors = rng.normal(size=(len(docs), 16)).tolist()
+    return CompactVectorStore.from_embeddings(docs, [doc.id for doc in docs], vectors, dtype), vectors
+
+
+def test_rows_accepts_a_generator():
+    store, _ = make_store("int8")
+    assert store.rows(i for i in (0, 3, 5)).shape == (3, 16)
+
+
+def test_mmr_on_int8_store():
+    store, vectors = make_store("int8")
+    retriever = HybridRetriever(store)
+    results = retriever.search_with_scores("python project", vectors[0], k=3, diversity=0.5)
+    assert len(results) == 3
+    assert len({chunk.id for chunk, _ in results}) == 3